@@ -0,0 +1,62 @@
+# -*- encoding: utf-8 -*-
+"""
+Shared setup for the benchmark scripts in this directory.
+
+Importing this module configures Django with the example project's settings against an in-memory
+sqlite database, so the scripts can be run straight from a checkout::
+
+    python benchmarks/row_renderer.py
+
+Run a script on the commits before and after a change to compare them.
+"""
+
+import os
+import sys
+import timeit
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'datatableview', 'tests', 'example_project'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'example_project.settings')
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+
+settings.DATABASES['default']['NAME'] = ':memory:'
+settings.DEBUG = False
+django.setup()
+call_command('migrate', verbosity=0, interactive=False)
+
+from example_project.example_app.models import Blog, Author, Entry
+
+
+def create_entries(count):
+    """ Creates ``count`` entries spread over a few blogs, each with two authors. """
+    blogs = [Blog.objects.create(name="Blog %d" % (i,), tagline="Tagline %d" % (i,))
+             for i in range(5)]
+    authors = [Author.objects.create(name="Author %d" % (i,), email="author%d@example.com" % (i,))
+               for i in range(5)]
+    Entry.objects.bulk_create([
+        Entry(blog=blogs[i % len(blogs)], headline="Headline %d" % (i,),
+              body_text="Body text %d" % (i,), pub_date=date(2010 + i % 10, i % 12 + 1, i % 28 + 1),
+              mod_date=date(2020, 1, 1), n_comments=i % 50, n_pingbacks=i % 7, rating=i % 5,
+              status=i % 2, is_published=bool(i % 2))
+        for i in range(count)
+    ])
+    through = Entry.authors.through
+    through.objects.bulk_create([
+        through(entry_id=entry_id, author_id=authors[(entry_id + j) % len(authors)].pk)
+        for entry_id in Entry.objects.values_list('pk', flat=True) for j in range(2)
+    ])
+
+
+def measure(f, number, repeat=5):
+    """ Returns the best time in seconds of ``repeat`` runs of ``number`` calls to ``f``. """
+    return min(timeit.repeat(f, number=number, repeat=repeat)) / number
+
+
+def report(label, seconds, unit='us'):
+    scale = {'s': 1, 'ms': 1e3, 'us': 1e6}[unit]
+    print("%-40s %10.1f %s" % (label, seconds * scale, unit))
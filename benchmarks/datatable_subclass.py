@@ -0,0 +1,49 @@
+# -*- encoding: utf-8 -*-
+"""
+Times the per-request synthesis of a view's Datatable class: building the subclass with ``type()``
+against the cached :py:func:`~datatableview.views.base.get_datatable_subclass`, and
+``DatatableView.get_datatable()`` end to end.
+"""
+
+from common import create_entries, measure, report, Entry
+
+from django.test import RequestFactory
+
+from datatableview import Datatable
+from datatableview.views import DatatableView
+try:
+    from datatableview.views.base import get_datatable_subclass
+except ImportError:  # Before subclasses were cached
+    get_datatable_subclass = None
+
+
+class EntryDatatable(Datatable):
+    class Meta:
+        columns = ['id', 'blog', 'headline', 'pub_date', 'n_comments', 'n_pingbacks', 'rating',
+                   'status']
+
+
+class EntryDatatableView(DatatableView):
+    model = Entry
+    datatable_class = EntryDatatable
+
+
+def main():
+    create_entries(10)
+    view = EntryDatatableView()
+    view.request = RequestFactory().get('/', {'draw': '1', 'start': '0', 'length': '25'})
+    view.args, view.kwargs = (), {}
+
+    opts = EntryDatatable.options_class(EntryDatatable._meta)
+    opts.model = Entry
+    name = 'EntryDatatable_Synthesized'
+    report("type() per request",
+           measure(lambda: type(name, (EntryDatatable,), {'Meta': opts}), number=1000))
+    if get_datatable_subclass is not None:
+        report("get_datatable_subclass() per request",
+               measure(lambda: get_datatable_subclass(name, EntryDatatable, opts), number=1000))
+    report("View.get_datatable()", measure(view.get_datatable, number=1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+# -*- encoding: utf-8 -*-
+"""
+Times ``Datatable.get_record_data()`` for a page of 1000 entries across 8 columns, which is the
+per-row work behind every ajax response.
+"""
+
+from common import create_entries, measure, report, Entry
+
+from datatableview import Datatable
+
+ROWS = 1000
+
+
+class EntryDatatable(Datatable):
+    class Meta:
+        model = Entry
+        columns = ['id', 'blog', 'headline', 'pub_date', 'n_comments', 'n_pingbacks', 'rating',
+                   'status']
+
+
+def main():
+    create_entries(ROWS)
+    queryset = Entry.objects.select_related('blog')
+    objects = list(queryset)
+
+    def render_page():
+        datatable = EntryDatatable(queryset, '/')
+        datatable.configure()
+        for obj in objects:
+            datatable.get_record_data(obj)
+
+    report("get_record_data() per row", measure(render_page, number=1) / ROWS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# -*- encoding: utf-8 -*-
+"""
+Times ``Datatable.search()`` for a 5-term global search over 30 columns of Entry, which builds the
+``Q`` objects for every term and column and filters the queryset with them.
+"""
+
+from common import create_entries, measure, report, Entry
+
+from datatableview import Datatable, columns
+
+FIELDS = ['id', 'headline', 'body_text', 'pub_date', 'mod_date', 'n_comments', 'n_pingbacks',
+          'rating', 'status', 'is_published', 'blog__name', 'blog__tagline', 'authors__name',
+          'authors__email', 'blog__id']
+COLUMN_CLASSES = {
+    'id': columns.IntegerColumn, 'blog__id': columns.IntegerColumn,
+    'n_comments': columns.IntegerColumn, 'n_pingbacks': columns.IntegerColumn,
+    'rating': columns.IntegerColumn, 'status': columns.IntegerColumn,
+    'pub_date': columns.DateColumn, 'mod_date': columns.DateColumn,
+    'is_published': columns.BooleanColumn,
+}
+SEARCH = 'headline 2015 published 12 author'
+
+
+def get_datatable_class(count=30):
+    attrs = {}
+    for i in range(count):
+        source = FIELDS[i % len(FIELDS)]
+        column_class = COLUMN_CLASSES.get(source, columns.TextColumn)
+        attrs['column_%d' % (i,)] = column_class("Column %d" % (i,), sources=[source])
+    attrs['Meta'] = type('Meta', (), {'model': Entry, 'columns': sorted(attrs)})
+    return type('SearchDatatable', (Datatable,), attrs)
+
+
+def main():
+    create_entries(100)
+    datatable_class = get_datatable_class()
+    queryset = Entry.objects.all()
+
+    def search():
+        datatable = datatable_class(queryset, '/', query_config={'search[value]': SEARCH})
+        datatable.configure()
+        datatable.search(queryset)
+
+    report("Datatable.search(), 5 terms x 30 columns", measure(search, number=20), unit='ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,8 @@
 
 from .datatables import Datatable, ValuesDatatable, LegacyDatatable
 from .columns import (Column, TextColumn, DateColumn, DateTimeColumn, BooleanColumn, IntegerColumn,
-                      FloatColumn, DisplayColumn, CompoundColumn)
+                      FloatColumn, DisplayColumn, CompoundColumn, ExpressionColumn, AggregateColumn,
+                      CountColumn, SumColumn, MinColumn, MaxColumn, AvgColumn)
 from .exceptions import SkipRecord
 
 __name__ = 'datatableview'
@@ -2,7 +2,7 @@
 
 import re
 import operator
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 try:
     from functools import reduce
 except ImportError:
@@ -10,9 +10,15 @@ except ImportError:
 
 import django
 from django.db import models
-from django.db.models import Model, Manager, Q
+from django.db.models import Model, Manager, Q, Count, Sum, Min, Max, Avg
+try:
+    from django.db.models import OuterRef, Subquery
+except ImportError:  # Django < 1.11
+    OuterRef = Subquery = None
 from django.db.models.fields import FieldDoesNotExist
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
 from django.utils.encoding import smart_text
 from django.utils.safestring import mark_safe
 try:
@@ -28,7 +34,8 @@ except ImportError:
 import six
 import dateutil.parser
 
-from .utils import resolve_orm_path, DEFAULT_EMPTY_VALUE, DEFAULT_MULTIPLE_SEPARATOR
+from .utils import (resolve_orm_path, classify_term, DEFAULT_EMPTY_VALUE,
+                    DEFAULT_MULTIPLE_SEPARATOR)
 
 # Registry of Column subclasses to their declared corresponding ModelFields.
 # The registery is an ordered priority list, containing 2-tuples of a Column subclass and a list of
@@ -45,6 +52,59 @@ STRPTIME_PLACEHOLDERS = {
     'week_day': ('%w',),
 }
 
+# ISO-style year, month or day search terms: '2023', '2023-05', '2023-05-04' ('/' and '.' also work)
+DATE_PERIOD_RE = re.compile(r'^(\d{4})(?:[-/.](\d{1,2})(?:[-/.](\d{1,2}))?)?$')
+
+# Separates the two ends of an explicit date range term: '2023-01..2023-03', '2023-01 .. 2023-03',
+# '2023 to 2024'.  Search strings are split on spaces, so the spaced forms only arrive intact when
+# they are quoted.
+DATE_RANGE_SEPARATOR_RE = re.compile(r'\s*\.\.\s*|\s+(?:-|to)\s+')
+
+def parse_date_period(term):
+    """
+    Parses an ISO-style year, month, or day search ``term`` into a 3-tuple of the period's first
+    day, the first day after the period, and the name of the period (``'year'``, ``'month'`` or
+    ``'day'``), so that it can be searched with a half-open ``__gte``/``__lt`` range.  Returns
+    ``None`` for anything else.
+    """
+    match = DATE_PERIOD_RE.match(term.strip())
+    if match is None:
+        return None
+    year, month, day = [int(bit) if bit else None for bit in match.groups()]
+    try:
+        if day is not None:
+            start = date(year, month, day)
+            return start, start + timedelta(days=1), 'day'
+        if month is not None:
+            return date(year, month, 1), date(year + month // 12, month % 12 + 1, 1), 'month'
+        return date(year, 1, 1), date(year + 1, 1, 1), 'year'
+    except (ValueError, OverflowError):
+        return None
+
+def parse_date_range(term):
+    """
+    Parses an explicit range between two :py:func:`parse_date_period` terms into the 2-tuple of the
+    first day of the first period and the first day after the second period.  Returns ``None`` if
+    ``term`` isn't a valid range.
+    """
+    bits = DATE_RANGE_SEPARATOR_RE.split(term.strip())
+    if len(bits) != 2:
+        return None
+    first, last = parse_date_period(bits[0]), parse_date_period(bits[1])
+    if first is None or last is None or first[0] >= last[1]:
+        return None
+    return first[0], last[1]
+
+# Unbound model field instances used only for their get_prep_value(), keyed by field class
+_prep_fields = {}
+
+def get_prep_field(model_field_class):
+    """ Returns a shared, unbound instance of ``model_field_class`` for coercing search terms. """
+    try:
+        return _prep_fields[model_field_class]
+    except KeyError:
+        return _prep_fields.setdefault(model_field_class, model_field_class())
+
 def register_simple_modelfield(model_field):
     column_class = get_column_for_modelfield(model_field)
     COLUMN_CLASSES.insert(0, (column_class, [model_field]))
@@ -73,10 +133,41 @@ def get_attribute_value(obj, bit):
                 value = value()
     return value
 
+def bind_search_plan(plan, planned_column, column):
+    """
+    Returns a copy of the search ``plan`` compiled by ``planned_column`` whose methods are bound to
+    the equally configured ``column`` instead, following nested columns in ``sources`` too.
+    Methods of other handlers (the generic columns created for plain ORM paths) are kept.
+    """
+    handlers = {}
+    pairs = [(planned_column, column)]
+    while pairs:
+        planned, current = pairs.pop()
+        handlers[id(planned)] = current
+        pairs.extend((planned_source, source)
+                     for planned_source, source in zip(planned.sources, current.sources)
+                     if isinstance(planned_source, Column) and isinstance(source, Column))
+
+    def bind(method):
+        handler = handlers.get(id(getattr(method, '__self__', None)))
+        if handler is None:
+            return method
+        return six.create_bound_method(six.get_method_function(method), handler)
+
+    return [(sub_source, choices, bind(accepts_term),
+             [(lookup_type, bind(prep_search_value), bind(get_search_query))
+              for lookup_type, prep_search_value, get_search_query in lookups])
+            for sub_source, choices, accepts_term, lookups in plan]
+
 class ColumnMetaclass(type):
     """ Column type for automatic registration of column types as ModelField handlers. """
     def __new__(cls, name, bases, attrs):
         new_class = super(ColumnMetaclass, cls).__new__(cls, name, bases, attrs)
+
+        # A new prep_search_value() may accept terms that the inherited term_kinds didn't
+        if 'prep_search_value' in attrs and 'term_kinds' not in attrs:
+            new_class.term_kinds = None
+
         if new_class.model_field_class:
             COLUMN_CLASSES.insert(0, (new_class, [new_class.model_field_class]))
             if new_class.handles_field_classes:
@@ -94,6 +185,9 @@ class Column(six.with_metaclass(ColumnMetaclass)):
 
     lookup_types = ()
 
+    # Kinds of search term (see utils.classify_term) that prep_search_value() can use, or None for any
+    term_kinds = None
+
     # Tracks each time a Field instance is created. Used to retain order.
     creation_counter = 0
 
@@ -221,6 +315,14 @@ class Column(six.with_metaclass(ColumnMetaclass)):
             raise ValueError("Unknown object type %r" % (repr(obj),))
         return [value]
 
+    def get_annotations(self, model):
+        """
+        Returns a dictionary of ``queryset.annotate()`` aliases to the expressions this column needs
+        the :py:class:`~datatableview.datatables.Datatable` to annotate onto its object list of
+        ``model`` instances.
+        """
+        return {}
+
     def get_processor_kwargs(self, **extra_kwargs):
         """
         Returns a dictionary of kwargs that should be sent to this column's :py:attr:`processor`
@@ -306,7 +408,7 @@ class Column(six.with_metaclass(ColumnMetaclass)):
         if multi_terms:
             return filter(None, (self.prep_search_value(multi_term, lookup_type) for multi_term in multi_terms))
 
-        model_field = self.model_field_class()
+        model_field = get_prep_field(self.model_field_class)
         try:
             term = model_field.get_prep_value(term)
         except:
@@ -314,6 +416,15 @@ class Column(six.with_metaclass(ColumnMetaclass)):
 
         return term
 
+    def accepts_term(self, term, kinds):
+        """
+        Returns a boolean indicating if ``term``, classified as the set of ``kinds`` by
+        :py:func:`~datatableview.utils.classify_term`, could possibly be coerced by
+        :py:meth:`.prep_search_value`.  Terms that are rejected here are never offered to the
+        column's lookups.  The default implementation compares ``kinds`` to :py:attr:`.term_kinds`.
+        """
+        return self.term_kinds is None or not kinds.isdisjoint(self.term_kinds)
+
     def get_lookup_types(self, handler=None):
         """
         Generates the list of valid ORM lookup operators, taking into account runtime options for
@@ -347,36 +458,87 @@ class Column(six.with_metaclass(ColumnMetaclass)):
         The default implementation will also discover terms that match the source field's
         ``choices`` labels, flipping the term to automatically query for the internal choice value.
         """
-        sources = self.get_db_sources(model)
-        column_queries = []
-        for source in sources:
+        return self.search_plan(self.get_search_plan(model, lookup_types), term,
+                                classify_term(term))
+
+    def get_search_plan(self, model, lookup_types=None):
+        """
+        Compiles the parts of :py:meth:`.search` that do not depend on the search term, so that a
+        :py:class:`~datatableview.datatables.Datatable` can reuse them for every term and request.
+
+        Returns a list of 4-tuples for each database-backed source: the ORM path, the list of its
+        ``(db_value, label)`` choices (if any), the handler's :py:meth:`.accepts_term` method, and
+        a list of ``(lookup_type, prep_search_value, get_search_query)`` items holding the handler's
+        term coercion and query building methods.  Each source gets the lookup types of its own
+        handler unless ``lookup_types`` is given.
+        """
+        plan = []
+        for source in self.get_db_sources(model):
             handler = self.get_source_handler(model, source)
+            source_lookup_types = lookup_types or handler.get_lookup_types()
 
             for sub_source in self.expand_source(source):
                 modelfield = resolve_orm_path(model, sub_source)
+                choices = []
                 if modelfield.choices:
                     if hasattr(modelfield, 'get_choices'):
                         choices = modelfield.get_choices()
                     else:
                         choices = modelfield.get_flatchoices()
-                    for db_value, label in choices:
-                        if term.lower() in label.lower():
-                            k = '%s__exact' % (sub_source,)
-                            column_queries.append(Q(**{k: str(db_value)}))
-
-                if not lookup_types:
-                    lookup_types = handler.get_lookup_types()
-                for lookup_type in lookup_types:
-                    coerced_term = handler.prep_search_value(term, lookup_type)
-                    if coerced_term is None:
-                        # Skip terms that don't work with the lookup_type
-                        continue
-                    elif lookup_type in ('in', 'range') and not isinstance(coerced_term, tuple):
-                        # Skip attempts to build multi-component searches if we only have one term
-                        continue
-
-                    k = '%s__%s' % (sub_source, lookup_type)
-                    column_queries.append(Q(**{k: coerced_term}))
+                    choices = [(str(db_value), label) for db_value, label in choices]
+
+                lookups = [(lookup_type, handler.prep_search_value, handler.get_search_query)
+                           for lookup_type in source_lookup_types]
+                plan.append((sub_source, choices, handler.accepts_term, lookups))
+        return plan
+
+    def get_search_plan_key(self):
+        """
+        Returns a hashable description of the declaration that :py:meth:`.get_search_plan`
+        compiles, so that a :py:class:`~datatableview.datatables.Datatable` can share one plan
+        between equally configured columns.  Subclasses whose plans depend on other attributes
+        should add them to the key.
+        """
+        sources = tuple(source.get_search_plan_key() if isinstance(source, Column) else source
+                        for source in self.sources)
+        return (type(self), sources, tuple(self.lookup_types), self.allow_regex,
+                self.allow_full_text_search)
+
+    def get_search_query(self, source, lookup_type, term):
+        """
+        Returns the ``Q`` object that searches the ORM path ``source`` for ``term``, which has
+        already been coerced by :py:meth:`.prep_search_value` for the given ``lookup_type``.
+        """
+        return Q(**{'%s__%s' % (source, lookup_type): term})
+
+    def search_plan(self, plan, term, kinds=None):
+        """
+        Returns the ``Q`` object for ``term`` against a plan from :py:meth:`.get_search_plan`, or
+        ``None`` if the term can't be used against any of the planned lookups.  When the term's
+        ``kinds`` are given, sources whose handler doesn't :py:meth:`.accepts_term` them only have
+        their choice labels searched.
+        """
+        column_queries = []
+        term_lower = term.lower()
+        for sub_source, choices, accepts_term, lookups in plan:
+            for db_value, label in choices:
+                if term_lower in label.lower():
+                    k = '%s__exact' % (sub_source,)
+                    column_queries.append(Q(**{k: db_value}))
+
+            if kinds is not None and not accepts_term(term, kinds):
+                continue
+
+            for lookup_type, prep_search_value, get_search_query in lookups:
+                coerced_term = prep_search_value(term, lookup_type)
+                if coerced_term is None:
+                    # Skip terms that don't work with the lookup_type
+                    continue
+                elif lookup_type in ('in', 'range') and not isinstance(coerced_term, tuple):
+                    # Skip attempts to build multi-component searches if we only have one term
+                    continue
+
+                column_queries.append(get_search_query(sub_source, lookup_type, coerced_term))
 
         if column_queries:
             q = reduce(operator.or_, column_queries)
@@ -436,9 +598,25 @@ class DateColumn(Column):
     model_field_class = models.DateField
     handles_field_classes = [models.DateField]
     lookup_types = ('exact', 'in', 'range', 'year', 'month', 'day', 'week_day')
+    term_kinds = ('date',)
 
     def prep_search_value(self, term, lookup_type):
-        if lookup_type in ('exact', 'in', 'range'):
+        # ISO-style full dates are read strictly, and months and explicit ranges are coerced to
+        # (start, end) date pairs for the 'range' lookup.  get_search_query() searches both as
+        # index-friendly ranges.  A single year or day is already covered by the 'year' and
+        # 'exact' lookups, so 'range' only takes the rest.
+        if lookup_type in ('exact', 'range'):
+            period = parse_date_period(term)
+            if period is not None:
+                if lookup_type == 'exact' and period[2] == 'day':
+                    return period[0]
+                if lookup_type == 'range' and period[2] == 'month':
+                    return period[:2]
+                return None
+            if lookup_type == 'range':
+                return parse_date_range(term)
+
+        if lookup_type in ('exact', 'in'):
             try:
                 date_obj = dateutil.parser.parse(term)
             except ValueError:
@@ -473,14 +651,52 @@ class DateColumn(Column):
                         term = getattr(date_obj, lookup_type)
                     return str(term)
 
+            # The term isn't a valid value for this date part
+            return None
+
         return super(DateColumn, self).prep_search_value(term, lookup_type)
 
+    def get_search_query(self, source, lookup_type, term):
+        """
+        Searches ``year`` terms, ``exact`` dates (as the whole day) and the ``(start, end)`` date
+        pairs from :py:meth:`.prep_search_value` as half-open ``__gte``/``__lt`` ranges, which can
+        use an index on the column (unlike the ``EXTRACT()`` that a ``__year`` lookup generates).
+        """
+        if lookup_type == 'year':
+            period = parse_date_period(term)
+            if period is not None:
+                term = period[:2]
+        elif lookup_type == 'exact' and isinstance(term, date) and not isinstance(term, datetime):
+            term = (term, term + timedelta(days=1))
+        if isinstance(term, tuple) and lookup_type != 'in':
+            start, end = self.get_search_bounds(*term)
+            return Q(**{
+                '%s__gte' % (source,): start,
+                '%s__lt' % (source,): end,
+            })
+        return super(DateColumn, self).get_search_query(source, lookup_type, term)
+
+    def get_search_bounds(self, start, end):
+        """ Converts the ``start`` and ``end`` dates of a searched range to query values. """
+        return start, end
+
 
 class DateTimeColumn(DateColumn):
     model_field_class = models.DateTimeField
     handles_field_classes = [models.DateTimeField]
     lookups_types = ('exact', 'in', 'range', 'year', 'month', 'day', 'week_day')
 
+    def get_search_bounds(self, start, end):
+        """
+        Converts the range's dates to midnight datetimes, made aware in the current time zone when
+        ``USE_TZ`` is enabled, to match how Django evaluates ``__year`` and ``__date`` lookups.
+        """
+        bounds = [datetime.combine(start, time.min), datetime.combine(end, time.min)]
+        if settings.USE_TZ:
+            current_timezone = timezone.get_current_timezone()
+            bounds = [timezone.make_aware(value, current_timezone) for value in bounds]
+        return tuple(bounds)
+
 
 if django.VERSION >= (1, 6):
     DateTimeColumn.lookup_types += ('hour', 'minute', 'second')
@@ -490,6 +706,11 @@ class BooleanColumn(Column):
     model_field_class = models.BooleanField
     handles_field_classes = [models.BooleanField, models.NullBooleanField]
     lookup_types = ('exact', 'in')
+    term_kinds = ('boolean',)
+
+    def accepts_term(self, term, kinds):
+        # The column's own label also stands for a true value
+        return 'boolean' in kinds or bool(self.label and term.lower() in self.label.lower())
 
     def prep_search_value(self, term, lookup_type):
         term = term.lower()
@@ -506,12 +727,14 @@ class IntegerColumn(Column):
     model_field_class = models.IntegerField
     handles_field_classes = [models.IntegerField, models.AutoField]
     lookup_types = ('exact', 'in')
+    term_kinds = ('integer',)
 
 
 class FloatColumn(Column):
     model_field_class = models.FloatField
     handles_field_classes = [models.FloatField, models.DecimalField]
     lookup_types = ('exact', 'in')
+    term_kinds = ('decimal',)
 
 
 class CompoundColumn(Column):
@@ -577,6 +800,146 @@ class CompoundColumn(Column):
         return column_class()
 
 
+class ExpressionColumn(Column):
+    """
+    Column whose value is computed by the database from a Django query ``expression``, such as
+    ``Concat``, ``Coalesce``, ``Case``, ``F()`` arithmetic or a ``Subquery``.  The
+    :py:class:`~datatableview.datatables.Datatable` annotates the expression onto its object list
+    under the column's ``alias``, so that the column can be sorted and searched by the database
+    like any other model field, and its value is read from the annotated attribute.
+
+    The column class that handles searching (and therefore the lookup types used) is chosen from
+    the registry according to the expression's ``output_field``.
+
+    ``sources`` can't be given, since the expression is the only source.  The ``alias`` defaults
+    to a name that is unique to this column declaration.  Query expressions require Django 1.8 or
+    later.
+    """
+
+    model_field_class = None
+    handles_field_classes = []
+    lookup_types = ()
+
+    def __init__(self, label=None, expression=None, alias=None, sortable=True, **kwargs):
+        if django.VERSION < (1, 8):
+            raise ValueError("%s requires Django 1.8 or later." % (self.__class__.__name__,))
+        if expression is None and six.get_unbound_function(type(self).get_expression) is \
+                six.get_unbound_function(ExpressionColumn.get_expression):
+            raise ValueError("ExpressionColumn requires an 'expression'.")
+        if kwargs.get('source') or kwargs.get('sources'):
+            raise ValueError("ExpressionColumn can't be given 'source' or 'sources'.")
+        super(ExpressionColumn, self).__init__(label, sortable=sortable, **kwargs)
+        self.expression = expression
+        self.alias = alias or 'datatableview_expression_%d' % (self.creation_counter,)
+        self.sources = [self.alias]
+        self.sortable = sortable
+        self._output_fields = {}
+
+    def get_annotations(self, model):
+        return {self.alias: self.get_expression(model)}
+
+    def get_expression(self, model):
+        """ Returns the expression to annotate onto querysets of ``model``. """
+        return self.expression
+
+    def get_output_field(self, model):
+        """
+        Returns the ``output_field`` of the expression once it is resolved against ``model``.
+        """
+        try:
+            return self._output_fields[model]
+        except KeyError:
+            query = model._base_manager.annotate(**self.get_annotations(model)).query
+            output_field = query.annotations[self.alias].output_field
+            return self._output_fields.setdefault(model, output_field)
+
+    def resolve_source(self, model, source):
+        if source == self.alias:
+            return self.get_output_field(model)
+        return super(ExpressionColumn, self).resolve_source(model, source)
+
+    def get_source_handler(self, model, source):
+        """ Searches are delegated to the registered column class for the ``output_field``. """
+        column_class = get_column_for_modelfield(self.get_output_field(model)) or Column
+        return column_class()
+
+    def get_search_plan_key(self):
+        return super(ExpressionColumn, self).get_search_plan_key() + (self.expression,)
+
+    def get_search_plan(self, model, lookup_types=None):
+        handler = self.get_source_handler(model, self.alias)
+        lookups = [(lookup_type, handler.prep_search_value, handler.get_search_query)
+                   for lookup_type in lookup_types or handler.get_lookup_types()]
+        return [(self.alias, [], handler.accepts_term, lookups)]
+
+
+class AggregateColumn(ExpressionColumn):
+    """
+    Column holding an ``aggregate`` (``Count``, ``Sum``, ``Min``, ``Max``, ``Avg``) of the ORM path
+    given as its ``source``, typically across a relationship to multiple items, such as
+    ``AggregateColumn("Comments", source='comment', aggregate=Count)``.  The subclasses
+    :py:class:`CountColumn`, :py:class:`SumColumn`, :py:class:`MinColumn`, :py:class:`MaxColumn`
+    and :py:class:`AvgColumn` fill in ``aggregate``.
+
+    The aggregate is computed by a correlated subquery per row, rather than by grouping the whole
+    object list.  The object list therefore has no ``GROUP BY``, so it can still be searched,
+    counted and paged as usual, and searches on the column's value are ordinary ``WHERE``
+    conditions.  On Django versions without ``Subquery``, the aggregate is annotated directly.
+    """
+
+    aggregate = None
+
+    def __init__(self, label=None, source=None, aggregate=None, distinct=False, **kwargs):
+        if not source or not isinstance(source, six.string_types):
+            raise ValueError("%s requires a 'source' ORM path to aggregate." % (
+                self.__class__.__name__,))
+        if aggregate is not None:
+            self.aggregate = aggregate
+        if self.aggregate is None:
+            raise ValueError("%s requires an 'aggregate'." % (self.__class__.__name__,))
+        self.source = source
+        self.distinct = distinct
+        super(AggregateColumn, self).__init__(label, **kwargs)
+
+    def get_search_plan_key(self):
+        return super(AggregateColumn, self).get_search_plan_key() + (
+            self.aggregate, self.source, self.distinct)
+
+    def get_aggregate(self):
+        """ Returns the aggregate expression for :py:attr:`source`. """
+        if self.distinct:
+            return self.aggregate(self.source, distinct=True)
+        return self.aggregate(self.source)
+
+    def get_expression(self, model):
+        aggregate = self.get_aggregate()
+        if Subquery is None:
+            return aggregate
+        queryset = model._base_manager.filter(pk=OuterRef('pk')).order_by().values('pk')
+        queryset = queryset.annotate(value=aggregate).values('value')
+        return Subquery(queryset, output_field=queryset.query.annotations['value'].output_field)
+
+
+class CountColumn(AggregateColumn):
+    aggregate = Count
+
+
+class SumColumn(AggregateColumn):
+    aggregate = Sum
+
+
+class MinColumn(AggregateColumn):
+    aggregate = Min
+
+
+class MaxColumn(AggregateColumn):
+    aggregate = Max
+
+
+class AvgColumn(AggregateColumn):
+    aggregate = Avg
+
+
 class DisplayColumn(Column):
     """
     Convenience column type for unsearchable, unsortable columns, which rely solely on a processor
@@ -32,3 +32,33 @@ def get_field(opts, field_name):
         field = opts.get_field(field_name)
         direct = not field.auto_created
     return field, direct
+
+
+def get_field_relation(opts, field_name):
+    """
+    Retrieves a field instance from a model opts object along with a description of it: a 4-tuple
+    of ``(field, related_model, plural, concrete)``, where ``related_model`` is ``None`` unless the
+    field is a relationship, ``plural`` is true for many-to-many and reverse foreign key
+    relationships, and ``concrete`` is true when the field is stored in ``opts``'s table.
+    """
+    if django.VERSION >= (1, 8):
+        field, _ = get_field(opts, field_name)
+        related_model = field.related_model if getattr(field, 'is_relation', False) else None
+        plural = bool(related_model and (field.many_to_many or field.one_to_many))
+        return field, related_model, plural, field.concrete
+
+    # Django 1.7 describes reverse relationships with RelatedObject instances
+    field, _, direct, m2m = opts.get_field_by_name(field_name)
+    if direct:
+        related_model = field.rel.to if field.rel else None
+        return field, related_model, m2m, not m2m
+    return field, field.model, m2m or not field.field.unique, False
+
+
+def prefetch_related_objects(model_instances, *related_lookups):
+    """ Runs ``prefetch_related()`` lookups on an already fetched list of model instances. """
+    if django.VERSION >= (1, 10):
+        from django.db.models import prefetch_related_objects
+        return prefetch_related_objects(model_instances, *related_lookups)
+    from django.db.models.query import prefetch_related_objects
+    return prefetch_related_objects(model_instances, related_lookups)
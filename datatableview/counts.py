@@ -0,0 +1,394 @@
+# -*- encoding: utf-8 -*-
+"""
+Strategies for counting the records behind a :py:class:`~datatableview.datatables.Datatable`.
+
+Each strategy's :py:meth:`~CountStrategy.count` returns a 2-tuple of ``(count, strategy_name)``,
+where ``strategy_name`` identifies the method that actually produced the number (a capped count
+that did not reach its cap is just an exact count, and a cache miss is reported as whatever the
+wrapped strategy did).
+"""
+
+import json
+import time
+import hashlib
+import logging
+
+from django.apps import apps
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:  # Django < 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
+from django.db import connections
+from django.db.models import IntegerField, signals
+try:
+    from django.db.models.expressions import RawSQL
+except ImportError:  # Django < 1.8
+    RawSQL = None
+
+import six
+
+log = logging.getLogger(__name__)
+
+
+def is_queryset(object_list):
+    """ Returns a boolean indicating if ``object_list`` is a lazy ORM queryset. """
+    return hasattr(object_list, 'query') and hasattr(object_list, 'count')
+
+
+def get_cache():
+    """
+    Returns Django's default cache.  Before Django 1.8, importing ``django.core.cache`` reads the
+    settings, so it can't happen while ``datatableview`` itself is imported.
+    """
+    from django.core.cache import cache
+    return cache
+
+
+def get_queryset_sql(queryset):
+    """
+    Returns the 2-tuple of ``(sql, params)`` that ``queryset`` would execute.  Raises
+    ``EmptyResultSet`` for querysets that can't match anything, such as ``none()`` and
+    ``filter(pk__in=[])``, since Django skips the query for those instead of compiling it.
+    """
+    return queryset.query.get_compiler(using=queryset.db).as_sql()
+
+
+class CountStrategy(object):
+    """
+    Base strategy.  Anything that is not a queryset (a list from a manual sort, a tuple of
+    distinct results, etc) is already in memory, so it is always counted with ``len()``.
+    """
+
+    name = None
+
+    def count(self, object_list):
+        if not is_queryset(object_list):
+            return len(object_list), ExactCount.name
+        return self.count_queryset(object_list)
+
+    def count_queryset(self, queryset):
+        raise NotImplementedError
+
+
+class ExactCount(CountStrategy):
+    """ Issues a ``SELECT COUNT(*)`` for the queryset. """
+
+    name = 'exact'
+
+    def count_queryset(self, queryset):
+        return queryset.count(), self.name
+
+
+class CappedCount(CountStrategy):
+    """
+    Counts no further than ``cap`` rows, allowing the database to stop scanning early.  When the
+    cap is reached, ``cap`` is returned and the result is reported as ``'capped'`` so that the
+    client can render something like "10,000+".
+    """
+
+    name = 'capped'
+
+    def __init__(self, cap=10000):
+        self.cap = cap
+
+    def count_queryset(self, queryset):
+        count = queryset[:self.cap + 1].count()
+        if count > self.cap:
+            return self.cap, self.name
+        return count, ExactCount.name
+
+
+class EstimatedCount(CountStrategy):
+    """
+    Asks the query planner for its row estimate instead of counting.  Estimates are only trusted
+    when they are at least ``threshold`` rows, since small tables are cheap to count exactly and
+    planner statistics are least accurate there.  Backends without a supported planner estimate
+    fall back to an exact count.
+    """
+
+    name = 'estimated'
+
+    def __init__(self, threshold=100000):
+        self.threshold = threshold
+
+    def count_queryset(self, queryset):
+        estimate = self.get_estimate(queryset)
+        if estimate is None or estimate < self.threshold:
+            return ExactCount().count_queryset(queryset)
+        return estimate, self.name
+
+    def get_estimate(self, queryset):
+        """ Returns the planner's row estimate for ``queryset``, or ``None`` if unavailable. """
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        sql = None
+        cursor = connection.cursor()
+        try:
+            sql, params = get_queryset_sql(queryset)
+            cursor.execute('EXPLAIN (FORMAT JSON) %s' % (sql,), params)
+            plan = cursor.fetchone()[0]
+        except EmptyResultSet:
+            return None
+        except Exception:
+            log.exception("Unable to read the planner estimate for %r", sql)
+            return None
+        finally:
+            cursor.close()
+
+        if isinstance(plan, six.string_types):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_query_tables(query):
+    """
+    Returns the set of table names that ``query`` reads, including the tables of subqueries in its
+    filters and annotations and of the queries combined with it by ``union()``.  Raw SQL from
+    ``extra()`` is not inspected.
+    """
+    tables = set([query.get_meta().db_table])
+    tables.update(join.table_name for join in query.alias_map.values())
+
+    subqueries = list(getattr(query, 'combined_queries', ()))
+    annotations = getattr(query, 'annotations', None)
+    if annotations is None:  # Django < 1.8
+        annotations = query.aggregates
+    nodes = [query.where] + list(annotations.values())
+    while nodes:
+        node = nodes.pop()
+        for value in (node, getattr(node, 'rhs', None), getattr(node, 'queryset', None)):
+            if hasattr(value, 'alias_map'):
+                subqueries.append(value)
+            elif hasattr(value, 'query') and hasattr(value.query, 'alias_map'):
+                subqueries.append(value.query)
+        nodes.extend(getattr(node, 'children', ()))
+        if hasattr(node, 'get_source_expressions'):
+            nodes.extend(expression for expression in node.get_source_expressions()
+                         if expression is not None)
+
+    for subquery in subqueries:
+        if subquery is not query:
+            tables.update(get_query_tables(subquery))
+    return tables
+
+
+def get_generation_key(table):
+    return 'datatableview:generation:%s' % (table,)
+
+
+def get_table_generations(tables):
+    """
+    Returns the list of current generation numbers for ``tables``, in sorted table order.  A
+    missing generation starts at the current time in milliseconds rather than at 1, so that an
+    evicted generation can't come back as a number that old cache entries were stored under.
+    """
+    cache = get_cache()
+    keys = [get_generation_key(table) for table in sorted(tables)]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, int(time.time() * 1000), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def invalidate_counts(model):
+    """
+    Bumps the generation of ``model``'s table (or of the table named by ``model``), so that every
+    :py:class:`CachedCount` of a query reading that table is counted again.  This happens
+    automatically for models registered by :py:func:`track_counts` when instances are saved or
+    deleted and when ``ManyToManyField`` relationships change, but it must be called by hand after
+    ``bulk_create()``, ``queryset.update()`` and raw SQL, which don't send those signals.
+    """
+    tables = [model] if isinstance(model, six.string_types) else \
+             [parent._meta.db_table for parent in [model] + list(model._meta.get_parent_list())]
+    for table in tables:
+        try:
+            get_cache().incr(get_generation_key(table))
+        except ValueError:  # No cached count has read this table
+            pass
+
+
+def _invalidate_counts_for_instance(sender, **kwargs):
+    invalidate_counts(sender)
+
+def _invalidate_counts_for_m2m(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_counts(sender)
+
+
+def get_table_models(tables):
+    """
+    Returns the set of model classes whose instances are stored in any of ``tables``, including
+    proxy models, subclasses whose parents are stored there, and auto-created ``through`` models.
+    """
+    tables = set(tables)
+    models = set()
+    for model in apps.get_models(include_auto_created=True):
+        stored = [model] + list(model._meta.get_parent_list())
+        if tables & set(stored_model._meta.db_table for stored_model in stored):
+            models.add(model)
+    return models
+
+
+def track_counts(*models):
+    """
+    Connects the signal receivers that call :py:func:`invalidate_counts` when instances of
+    ``models`` are saved or deleted, or when they are the ``through`` model of a changed
+    ``ManyToManyField``.  Receivers are connected per sender, so models that are never counted keep
+    Django's fast-path deletes.
+
+    :py:class:`CachedCount` calls this for the models behind every table it reads, but only in
+    the process serving the datatable.  Processes that write to those tables without serving it,
+    such as task workers, should call this for the affected models, for example from
+    ``AppConfig.ready()``.
+    """
+    for model in models:
+        dispatch_uid = 'datatableview.counts.%s.%s' % (model._meta.app_label,
+                                                         model._meta.model_name)
+        signals.post_save.connect(_invalidate_counts_for_instance, sender=model,
+                                  dispatch_uid=dispatch_uid)
+        signals.post_delete.connect(_invalidate_counts_for_instance, sender=model,
+                                    dispatch_uid=dispatch_uid)
+        signals.m2m_changed.connect(_invalidate_counts_for_m2m, sender=model,
+                                    dispatch_uid=dispatch_uid)
+
+# Tables whose models have been passed to track_counts() by a CachedCount
+_tracked_tables = set()
+
+def track_tables(tables):
+    """ Calls :py:func:`track_counts` for the models stored in ``tables``, once per table. """
+    untracked = set(tables) - _tracked_tables
+    if untracked:
+        track_counts(*get_table_models(untracked))
+        _tracked_tables.update(untracked)
+
+
+class CachedCount(CountStrategy):
+    """
+    Stores the result of another ``strategy`` (an exact count by default) in Django's cache
+    framework for ``timeout`` seconds, keyed by the queryset's SQL and parameters and by the
+    generations of the tables it reads.  The models stored in those tables are registered with
+    :py:func:`track_counts`, after which saving or deleting a row moves its table to a new
+    generation (see :py:func:`invalidate_counts`), so counts are only reused while the tables
+    behind them are unchanged.
+    """
+
+    name = 'cached'
+    key_prefix = 'datatableview:count'
+
+    def __init__(self, strategy=None, timeout=300):
+        self.strategy = get_count_strategy(strategy or ExactCount)
+        self.timeout = timeout
+
+    def get_cache_key(self, queryset):
+        sql, params = get_queryset_sql(queryset)
+        tables = get_query_tables(queryset.query)
+        track_tables(tables)
+        generations = get_table_generations(tables)
+        digest = hashlib.md5(six.text_type((queryset.db, sql, params, generations)).encode('utf-8'))
+        return '%s:%s' % (self.key_prefix, digest.hexdigest())
+
+    def count_queryset(self, queryset):
+        try:
+            key = self.get_cache_key(queryset)
+        except EmptyResultSet:
+            return 0, ExactCount.name
+        cache = get_cache()
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, self.name
+
+        count, name = self.strategy.count(queryset)
+        cache.set(key, count, self.timeout)
+        return count, name
+
+
+def supports_window_functions(connection):
+    """ Returns a boolean indicating if ``connection`` can run ``COUNT(*) OVER ()``. """
+    if RawSQL is None:
+        return False
+    supported = getattr(connection.features, 'supports_over_clause', None)
+    if supported is not None:
+        return supported
+    if connection.vendor == 'sqlite':
+        import sqlite3
+        return sqlite3.sqlite_version_info >= (3, 25, 0)
+    if connection.vendor == 'mysql':
+        return connection.mysql_version >= (8, 0, 2)
+    return connection.vendor in ('postgresql', 'oracle')
+
+
+if RawSQL is not None:
+    class WindowCountExpression(RawSQL):
+        """ ``COUNT(*) OVER ()``, which is never part of a ``GROUP BY``. """
+
+        def __init__(self):
+            super(WindowCountExpression, self).__init__('COUNT(*) OVER ()', (),
+                                                        output_field=IntegerField())
+
+        def get_group_by_cols(self, alias=None):
+            return []
+else:
+    WindowCountExpression = None
+
+
+class WindowCount(CountStrategy):
+    """
+    Selects ``COUNT(*) OVER ()`` as an extra column of the page query, so that the search results
+    are counted by the same round-trip that fetches the page.  The
+    :py:class:`~datatableview.datatables.Datatable` reads the count from the first row of the
+    page.  When the results are unsorted by the database (virtual sorting), paged by keyset, not
+    paged at all, or the database has no window functions, or the page comes back empty past the
+    first page, an exact count is used instead.  Django versions without ``RawSQL`` (before 1.8)
+    are treated as having no window functions.
+
+    As a ``total_count_strategy``, the page's count doubles as the total when no search is
+    applied.  Otherwise the total is counted exactly, so pairing this with a ``'cached'`` total is
+    usually best.
+    """
+
+    name = 'window'
+    alias = 'datatableview_window_count'
+
+    def count_queryset(self, queryset):
+        return ExactCount().count_queryset(queryset)
+
+    def supports(self, queryset):
+        return supports_window_functions(connections[queryset.db])
+
+    def annotate(self, queryset):
+        """ Adds the window count to the columns selected by ``queryset``. """
+        return queryset.annotate(**{self.alias: WindowCountExpression()})
+
+    def read(self, obj):
+        """ Returns the window count selected with ``obj``. """
+        if isinstance(obj, dict):
+            return obj[self.alias]
+        return getattr(obj, self.alias)
+
+
+# Names usable for the ``count_strategy`` and ``total_count_strategy`` Meta options.
+COUNT_STRATEGIES = {
+    ExactCount.name: ExactCount,
+    CappedCount.name: CappedCount,
+    EstimatedCount.name: EstimatedCount,
+    CachedCount.name: CachedCount,
+    WindowCount.name: WindowCount,
+}
+
+def get_count_strategy(strategy):
+    """
+    Normalizes ``strategy`` to a :py:class:`CountStrategy` instance.  A registered name from
+    ``COUNT_STRATEGIES``, a strategy class, or a configured instance are all accepted.
+    """
+    if isinstance(strategy, six.string_types):
+        try:
+            strategy = COUNT_STRATEGIES[strategy]
+        except KeyError:
+            raise ValueError("Unknown count strategy %r." % (strategy,))
+    if isinstance(strategy, type):
+        strategy = strategy()
+    return strategy
@@ -1,14 +1,32 @@
 # -*- encoding: utf-8 -*-
 
+import os
 import re
 import copy
+import json
+import base64
+import heapq
+import pickle
+import shutil
+import datetime
 import operator
+import tempfile
+import threading
 from collections import OrderedDict
+from itertools import islice
 try:
     from functools import reduce
 except ImportError:
     pass
-
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without the 'futures' package
+    ThreadPoolExecutor = None
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, close_old_connections
+from django.db.models import Q, Min, Max
 from django.db.models.fields import FieldDoesNotExist
 from django.template.loader import render_to_string
 try:
@@ -24,10 +42,54 @@ import six
 
 
 from .exceptions import ColumnError, SkipRecord
+from .counts import get_count_strategy, is_queryset, ExactCount, WindowCount
+from .search import get_search_backend
 from .columns import (Column, TextColumn, DateColumn, DateTimeColumn, BooleanColumn, IntegerColumn,
-                      FloatColumn, DisplayColumn, CompoundColumn, get_column_for_modelfield)
+                      FloatColumn, DisplayColumn, CompoundColumn, get_column_for_modelfield,
+                      bind_search_plan)
 from .utils import (OPTION_NAME_MAP, MINIMUM_PAGE_LENGTH, contains_plural_field, split_terms,
-                    resolve_orm_path)
+                    crosses_plural_relation, classify_term, resolve_orm_path,
+                    get_model_at_related_field, get_related_lookups, get_only_fields,
+                    CompositeSortKey, OffsetList)
+from .compat import prefetch_related_objects
+
+if six.PY2:
+    def coerce_text(value):
+        """ Converts a serialized column value to unicode, decoding byte strings as utf-8. """
+        if isinstance(value, str):
+            return value.decode('utf-8')
+        return six.text_type(value)
+else:
+    coerce_text = six.text_type
+
+# Most sorted runs that ``spill_sort`` merges at once, which bounds its open temporary files.
+SORT_MERGE_FAN_IN = 64
+
+# Size of the thread pool shared by every Datatable using the ``concurrent_queries`` option.
+QUERY_THREAD_POOL_SIZE = 4
+_query_executor = None
+_query_executor_lock = threading.Lock()
+
+
+def get_query_executor():
+    """ Returns the bounded thread pool that ``concurrent_queries`` run on, creating it once. """
+    global _query_executor
+    with _query_executor_lock:
+        if _query_executor is None:
+            _query_executor = ThreadPoolExecutor(max_workers=QUERY_THREAD_POOL_SIZE)
+    return _query_executor
+
+
+def run_query(f, *args):
+    """
+    Calls ``f(*args)`` on a worker thread.  The thread's database connections are then cleaned up
+    the same way as at the end of a request, according to each database's ``CONN_MAX_AGE``.
+    """
+    try:
+        return f(*args)
+    finally:
+        close_old_connections()
+
 
 def pretty_name(name):
     if not name:
@@ -124,6 +186,18 @@ class DatatableOptions(object):
         self.search_fields = getattr(options, 'search_fields', None)  # extra searchable ORM fields
         self.unsortable_columns = getattr(options, 'unsortable_columns', None)
         self.hidden_columns = getattr(options, 'hidden_columns', None)  # generated, but hidden
+        self.count_strategy = getattr(options, 'count_strategy', 'exact')
+        self.total_count_strategy = getattr(options, 'total_count_strategy', None)  # or count_strategy
+        self.pagination = getattr(options, 'pagination', 'offset')  # 'offset' or 'keyset'
+        self.sort_buffer_size = getattr(options, 'sort_buffer_size', None)  # in-memory sort entries
+        self.distinct_strategy = getattr(options, 'distinct_strategy', 'aggregate')  # or 'python'
+        self.search_strategy = getattr(options, 'search_strategy', 'or')  # or 'union'
+        self.concurrent_queries = getattr(options, 'concurrent_queries', False)  # on a thread pool
+        self.search_backend = getattr(options, 'search_backend', 'orm')  # answers global terms
+        self.search_index = getattr(options, 'search_index', None)  # backend's table name
+        self.optimize_related = getattr(options, 'optimize_related', True)  # plan related lookups
+        self.narrow_fields = getattr(options, 'narrow_fields', False)  # only() the needed fields
+        self.extra_fields = getattr(options, 'extra_fields', None)  # ORM paths processors need
 
         self.structure_template = getattr(options, 'structure_template', "datatableview/default_structure.html")
         self.footer = getattr(options, 'footer', False)
@@ -208,11 +282,21 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
             query_config = {}
         self.query_config = query_config
 
-        self.columns = copy.deepcopy(self.base_columns)
+        # Column declarations are shared, so a shallow copy is enough to give this instance its own
+        # sort state.
+        self.columns = OrderedDict((name, copy.copy(column))
+                                   for name, column in self.base_columns.items())
 
         self._force_distinct = force_distinct
         self.total_initial_record_count = None
         self.unpaged_record_count = None
+        self.total_initial_record_count_strategy = None
+        self.unpaged_record_count_strategy = None
+        self.next_cursor = None
+        self._row_renderer = None
+        self._window_count = None
+        self._page = None
+        self.preloaded_page_data = {}
 
     def configure(self):
         """
@@ -221,8 +305,10 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
         """
 
         self.resolve_virtual_columns(*tuple(self.missing_columns))
+        self._row_renderer = None
 
-        self.config = self.normalize_config(self._meta.__dict__, self.query_config)
+        # Copied, since the class's options are shared by every instance
+        self.config = self.normalize_config(dict(self._meta.__dict__), self.query_config)
 
         self.config['column_searches'] = {}
         for i, name in enumerate(self.columns.keys()):
@@ -244,6 +330,67 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
                 self.columns[column_name].sort_direction = 'desc' if name[0] == '-' else 'asc'
                 self.columns[column_name].index = index
 
+        self.select_related, self.prefetch_related = self.get_related_lookups()
+        self.only_fields = self.get_only_fields()
+
+    def get_related_lookups(self):
+        """
+        Inspects the ORM paths in every column's :py:attr:`~datatableview.columns.Column.sources`
+        (including the sources of columns nested in a
+        :py:class:`~datatableview.columns.CompoundColumn`) and returns a 2-tuple of
+        ``(select_related, prefetch_related)`` lookups that will let the page of results be read
+        without a query per row per relationship.
+
+        The ``select_related`` lookups are applied to the object list before searching and sorting,
+        while the ``prefetch_related`` lookups are run only against the objects in the current page.
+        Set ``optimize_related = False`` in the ``Meta`` options to disable this.
+        """
+        if not self.config['optimize_related'] or self.model is None:
+            return [], []
+        return get_related_lookups(self.model, self.get_column_orm_paths())
+
+    def get_column_orm_paths(self):
+        """
+        Returns the string sources of every column, with the sources of columns nested in a
+        :py:class:`~datatableview.columns.CompoundColumn` flattened into the list.
+        """
+        orm_paths = []
+        for column in self.columns.values():
+            for source in column.sources:
+                for sub_source in column.expand_source(source):
+                    if isinstance(sub_source, six.string_types):
+                        orm_paths.append(sub_source)
+        return orm_paths
+
+    def annotate_columns(self, queryset):
+        """
+        Applies the :py:meth:`~datatableview.columns.Column.get_annotations` of every column to
+        ``queryset``, skipping any aliases that it already has.
+        """
+        annotations = OrderedDict()
+        for column in self.columns.values():
+            for alias, expression in column.get_annotations(queryset.model).items():
+                if alias not in queryset.query.annotations:
+                    annotations[alias] = expression
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return queryset
+
+    def get_only_fields(self):
+        """
+        When the ``narrow_fields`` option is enabled, returns the minimal list of fields for
+        ``queryset.only()``: the ``pk``, the database-backed column sources, the database ordering
+        fields, and any ``extra_fields`` that processors or virtual sources read from the instance.
+        Returns ``None`` when narrowing is disabled.
+        """
+        if not self.config['narrow_fields'] or self.model is None:
+            return None
+
+        db, virtual = self.get_ordering_splits()
+        orm_paths = ['pk'] + self.get_column_orm_paths() + self.get_sort_fields(db)
+        orm_paths.extend(self.config['extra_fields'] or [])
+        return get_only_fields(self.model, orm_paths)
+
     # Client request configuration mergers
     def normalize_config(self, config, query_config):
         """
@@ -263,6 +410,7 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
         config['start_offset'] = self.normalize_config_start_offset(config, query_config)
         config['page_length'] = self.normalize_config_page_length(config, query_config)
         config['ordering'] = self.normalize_config_ordering(config, query_config)
+        config['cursor'] = self.normalize_config_cursor(config, query_config)
 
         return config
 
@@ -335,6 +483,50 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
             return default_ordering
         return ordering
 
+    def normalize_config_cursor(self, config, query_config):
+        """
+        Decodes the keyset pagination cursor sent back by the client, which is a copy of the
+        ``cursor`` value from the previous ajax response.  Its values are coerced by
+        :py:meth:`.clean_keyset_value`.  Malformed cursors are ignored, which just means that
+        offset paging will be used for the request.
+        """
+        cursor = query_config.get(OPTION_NAME_MAP['cursor'], None)
+        if not cursor or self.model is None:
+            return None
+        try:
+            offset, ordering, values = json.loads(base64.urlsafe_b64decode(str(cursor)).decode('utf-8'))
+            offset = int(offset)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(ordering, list) or not isinstance(values, list) or \
+                len(ordering) != len(values):
+            return None
+        try:
+            values = [self.clean_keyset_value(orm_path, value)
+                      for orm_path, value in zip(ordering, values)]
+        except (ValidationError, FieldDoesNotExist, TypeError, ValueError):
+            return None
+        return {
+            'offset': offset,
+            'ordering': ordering,
+            'values': values,
+        }
+
+    def clean_keyset_value(self, orm_path, value):
+        """
+        Returns the cursor ``value`` for ``orm_path`` as the field's python value.  Only non-null
+        JSON scalars are accepted, since keyset ordering never includes nullable fields; anything
+        else, or a value the field rejects, raises ``ValueError`` or ``ValidationError``.
+        """
+        if not isinstance(orm_path, six.string_types):
+            raise ValueError("Invalid cursor ordering %r" % (orm_path,))
+        if value is None or not isinstance(value, six.string_types + six.integer_types + (float,)):
+            raise ValueError("Invalid cursor value %r" % (value,))
+        field = resolve_orm_path(self.model, orm_path.lstrip('-'))
+        value = field.to_python(value)
+        field.get_prep_value(value)  # Some fields only reject bad values here
+        return value
+
     def resolve_virtual_columns(self, *names):
         """
         Called with ``*args`` from the Meta.columns declaration that don't match the model's known
@@ -381,18 +573,130 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
                 virtual_fields.append(name)
         return db_fields, virtual_fields
 
+    def get_sort_fields(self, names):
+        """
+        Expands the db-backed column ``names`` (as found in the ``ordering`` configuration, with
+        optional ``+`` or ``-`` prefixes) into the ORM paths to send to ``queryset.order_by()``.
+        """
+        fields = []
+        for name in names:
+            sort_direction = ''
+            if name[0] in '+-':
+                sort_direction = name[0]
+                if sort_direction == '+':
+                    sort_direction = ''
+                name = name[1:]
+            column = self.columns[name]
+            sources = column.get_sort_fields(self.model)
+            if sources:
+                fields.extend([(sort_direction + source) for source in sources])
+        return fields
+
+    # Keyset pagination
+    def get_keyset_ordering(self):
+        """
+        Returns the list of ORM ordering paths that keyset pagination will seek on, ending with a
+        ``pk`` tie-breaker so that every row has a unique position.  ``None`` is returned when the
+        ``pagination`` option isn't ``'keyset'``, or when the current ordering can't be expressed
+        as a seek predicate (virtual ordering columns, plural relationships, nullable fields, or
+        relationship fields ordered by their related model).  Offset paging is used in those cases.
+        """
+        if self.config['pagination'] != 'keyset' or self.config['page_length'] == -1:
+            return None
+        if not is_queryset(self.object_list) or self.model is None:
+            return None
+
+        db, virtual = self.get_ordering_splits()
+        if virtual:
+            return None
+
+        ordering = self.get_sort_fields(db)
+        for orm_path in ordering:
+            bits = orm_path.lstrip('-').split('__')
+            if bits == ['pk']:
+                continue
+            if contains_plural_field(self.model, [orm_path]):
+                return None
+            for i in range(len(bits)):
+                try:
+                    field = resolve_orm_path(self.model, '__'.join(bits[:i + 1]))
+                except FieldDoesNotExist:  # Column annotation
+                    return None
+                if field.null or (i == len(bits) - 1 and field.rel):
+                    return None
+
+        pk_name = self.model._meta.pk.name
+        if not set(['pk', '-pk', pk_name, '-' + pk_name]) & set(ordering):
+            ordering.append('pk')
+        return ordering
+
+    def get_keyset_filter(self, ordering, values):
+        """
+        Builds the seek predicate that selects the rows positioned after the python ``values`` in
+        ``ordering``: ``(a > x) OR (a = x AND b > y) OR ...``, with the comparison flipped for
+        descending fields.
+        """
+        queries = []
+        equalities = {}
+        for orm_path, value in zip(ordering, values):
+            name = orm_path.lstrip('-')
+            lookup = 'lt' if orm_path[0] == '-' else 'gt'
+            queries.append(Q(**dict(equalities, **{'%s__%s' % (name, lookup): value})))
+            equalities[name] = value
+        return reduce(operator.or_, queries)
+
+    def get_keyset_cursor(self, obj, ordering):
+        """
+        Returns the opaque cursor string that lets the client seek directly to the page following
+        the one ending with ``obj``.  ``None`` is returned if ``obj`` doesn't expose its ordering
+        values.
+        """
+        values = []
+        for orm_path in ordering:
+            name = orm_path.lstrip('-')
+            if name == 'pk':
+                value = self.get_object_pk(obj)
+            elif isinstance(obj, dict):
+                if name not in obj:
+                    return None
+                value = obj[name]
+            else:
+                value = reduce(getattr, [obj] + name.split('__'))
+            if isinstance(value, (datetime.datetime, datetime.time)):
+                # DjangoJSONEncoder truncates these to milliseconds, which wouldn't seek past rows
+                # that differ only by their microseconds.
+                value = value.isoformat()
+            values.append(value)
+
+        offset = self.config['start_offset'] + self.config['page_length']
+        cursor = json.dumps([offset, ordering, values], cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+
     # Data retrieval
     def _get_current_page(self):
         """
         If page_length is specified in the options or AJAX request, the result list is shortened to
         the correct offset and length.  Paged or not, the finalized object_list is then returned.
+
+        When keyset pagination is active and the client's cursor points at the requested offset,
+        the page is fetched with a seek predicate instead of a database ``OFFSET``.
         """
 
+        object_list = self._records
+
         # Narrow the results to the appropriate page length for serialization
         if self.config['page_length'] != -1:
             i_begin = self.config['start_offset']
             i_end = self.config['start_offset'] + self.config['page_length']
-            object_list = self._records[i_begin:i_end]
+
+            ordering = self.get_keyset_ordering()
+            cursor = self.config['cursor']
+            if ordering and cursor and cursor['offset'] == i_begin \
+                    and cursor['ordering'] == ordering:
+                keyset_filter = self.get_keyset_filter(ordering, cursor['values'])
+                object_list = self._records.filter(keyset_filter)[:self.config['page_length']]
+            else:
+                object_list = self._records[i_begin:i_end]
 
         return object_list
 
@@ -407,8 +711,58 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
         if not hasattr(self, '_records'):
             self.populate_records()
 
+        page, self._page = self._page, None
+        if page is None:
+            page = list(self._get_current_page())
+        if self._window_count is not None:
+            self.read_window_count(page)
+        page_data = self.process_page(page)
+
+        self.next_cursor = None
+        if page and len(page) == self.config['page_length']:
+            ordering = self.get_keyset_ordering()
+            if ordering:
+                self.next_cursor = self.get_keyset_cursor(page[-1], ordering)
+        return page_data
+
+    def iter_records(self, chunk_size=1000):
+        """
+        Like :py:meth:`.get_records`, but yields the processed results for the current page (which
+        is normally the entire unpaged list) one at a time, fetching and processing the underlying
+        objects ``chunk_size`` at a time.  Querysets are read with ``iterator()`` so that memory use
+        stays flat no matter how many results are requested.
+
+        :py:meth:`.preload_page_data` is called once per chunk.
+        """
+        if not hasattr(self, '_records'):
+            self.populate_records()
+
+        object_list = self._get_current_page()
+        if is_queryset(object_list):
+            object_list = object_list.iterator()
+        object_list = iter(object_list)
+
+        while True:
+            chunk = list(islice(object_list, chunk_size))
+            if not chunk:
+                break
+            for record_data in self.process_page(chunk):
+                yield record_data
+
+    def process_page(self, page):
+        """
+        Prefetches related lookups and preloaded data for the list of objects in ``page``, and then
+        calls :py:meth:`.get_record_data` for each one.  Records that raise
+        :py:exc:`~datatableview.exceptions.SkipRecord` are left out.
+
+        Returns the list of processed results.
+        """
+        if self.prefetch_related:
+            prefetch_related_objects(page, *self.prefetch_related)
+        self.preloaded_page_data = self.preload_page_data(page)
+
         page_data = []
-        for obj in self._get_current_page():
+        for obj in page:
             try:
                 record_data = self.get_record_data(obj)
             except SkipRecord:
@@ -430,11 +784,124 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
 
         self._records = None
         objects = self.object_list
+        if is_queryset(objects):
+            if self.select_related:
+                objects = objects.select_related(*self.select_related)
+            if self.only_fields:
+                objects = objects.only(*self.only_fields)
+            objects = self.annotate_columns(objects)
+        unsearched = objects
         objects = self.search(objects)
+
+        # A window count is read from the page query, so only the fallback is counted up front.
+        strategy = get_count_strategy(self.config['count_strategy'])
+        total_strategy = get_count_strategy(self.config['total_count_strategy'] or strategy)
+        window = self.use_window_count(objects, strategy)
+        window_total = window and objects is unsearched and isinstance(total_strategy, WindowCount)
+
+        self._window_count = None
+        self._page = None
+        self.unpaged_record_count, self.unpaged_record_count_strategy = None, None
+        self.total_initial_record_count, self.total_initial_record_count_strategy = None, None
+        counts = []
+        if not window:
+            counts.append(('unpaged_record_count', objects, strategy))
+        if not window_total:
+            counts.append(('total_initial_record_count', self.object_list, total_strategy))
+
+        # Counted before sorting, since a virtual sort only retains the rows up to the current page.
+        concurrent = self.use_concurrent_queries(objects)
+        if not concurrent:
+            for name, object_list, count_strategy in counts:
+                self.set_record_count(name, *self.count_records(object_list, count_strategy))
+
+        counted = objects
         objects = self.sort(objects)
+        if window:
+            if is_queryset(objects):
+                objects = strategy.annotate(objects)
+                self._window_count = (strategy, counted, window_total)
+            else:
+                self.unpaged_record_count, self.unpaged_record_count_strategy = \
+                        self.count_records(counted, ExactCount())
+                if window_total:
+                    self.total_initial_record_count, self.total_initial_record_count_strategy = \
+                            self.unpaged_record_count, self.unpaged_record_count_strategy
         self._records = objects
-        self.total_initial_record_count = len(self.object_list)
-        self.unpaged_record_count = len(self._records)
+
+        if concurrent:
+            self.run_concurrent_queries(counts)
+
+    def set_record_count(self, name, count, strategy_name):
+        """ Stores a count and its strategy name as the ``name`` and ``name_strategy`` attributes. """
+        setattr(self, name, count)
+        setattr(self, '%s_strategy' % (name,), strategy_name)
+
+    def use_concurrent_queries(self, object_list):
+        """
+        Returns a boolean indicating if the counts and page of ``object_list`` should be queried
+        concurrently, as the ``concurrent_queries`` option asks.  Worker threads have their own
+        database connections, which can't see the changes of a transaction that is still open on
+        this thread, so the queries are run in sequence inside of an atomic block.
+        """
+        return (self.config['concurrent_queries'] and ThreadPoolExecutor is not None
+                and is_queryset(object_list)
+                and not connections[object_list.db].in_atomic_block)
+
+    def run_concurrent_queries(self, counts):
+        """
+        Runs each of the ``(name, object_list, strategy)`` ``counts`` on the shared query thread
+        pool while the current page is fetched on this thread.  The page is kept for
+        :py:meth:`.get_records`.  Unpaged requests only have their counts run concurrently, since
+        their "page" is the entire result list, which :py:meth:`.iter_records` may stream instead.
+        """
+        executor = get_query_executor()
+        futures = [(name, executor.submit(run_query, self.count_records, object_list, strategy))
+                   for name, object_list, strategy in counts]
+
+        if self.config['page_length'] != -1:
+            self._page = list(self._get_current_page())
+            if self._window_count is not None:
+                self.read_window_count(self._page)
+
+        for name, future in futures:
+            self.set_record_count(name, *future.result())
+
+    def use_window_count(self, object_list, strategy):
+        """
+        Returns a boolean indicating if the search results in ``object_list`` can be counted by the
+        page query itself, as a :py:class:`~datatableview.counts.WindowCount` ``strategy`` asks.
+        Unpaged and keyset-paged requests are counted separately.
+        """
+        return (isinstance(strategy, WindowCount) and is_queryset(object_list)
+                and strategy.supports(object_list)
+                and self.config['page_length'] != -1 and self.get_keyset_ordering() is None)
+
+    def read_window_count(self, page):
+        """
+        Sets the counts that :py:meth:`.populate_records` left for the page query to provide, from
+        the first object of ``page``.  An empty page is only known to mean zero results when it is
+        the first page; otherwise the results are counted exactly.
+        """
+        strategy, counted, window_total = self._window_count
+        self._window_count = None
+        if page:
+            count = strategy.read(page[0]), strategy.name
+        elif self.config['start_offset'] == 0:
+            count = 0, strategy.name
+        else:
+            count = self.count_records(counted, ExactCount())
+        self.unpaged_record_count, self.unpaged_record_count_strategy = count
+        if window_total:
+            self.total_initial_record_count, self.total_initial_record_count_strategy = count
+
+    def count_records(self, object_list, strategy):
+        """
+        Counts ``object_list`` with the given ``strategy``, which may be any value accepted by
+        :py:func:`~datatableview.counts.get_count_strategy`.  Returns the 2-tuple of
+        ``(count, strategy_name)``, naming the strategy that actually produced the number.
+        """
+        return get_count_strategy(strategy).count(object_list)
 
     def search(self, queryset):
         """ Performs db-only queryset searches. """
@@ -449,20 +916,41 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
                 columns = searches.setdefault(term, {})
                 columns[name] = self.columns[name]
 
-        # Global search terms apply to all columns
-        for term in split_terms(self.config['search']):
+        # Global search terms apply to all columns, unless the search backend can answer them
+        global_terms = list(split_terms(self.config['search']))
+        if global_terms and is_queryset(queryset):
+            backend = get_search_backend(self.config['search_backend'])
+            searched = backend.search(self, queryset, global_terms)
+            if searched is not None:
+                queryset = searched
+                global_terms = []
+
+        for term in global_terms:
             # Allow global terms to overwrite identical queries that were single-column
             searches[term] = self.columns.copy()
 
         for term in searches.keys():
             term_queries = []
+            kinds = classify_term(term)
             for name, column in searches[term].items():
-                search_f = getattr(self, 'search_%s' % (name,), self._search_column)
-                q = search_f(column, term)
+                search_f = getattr(self, 'search_%s' % (name,), None)
+                plan = None
+                if search_f is None:
+                    plan = self.get_search_plan(name, column)
+                    search_f = self._search_column
+                if plan is not None:
+                    q = column.search_plan(plan, term, kinds)
+                else:
+                    q = search_f(column, term)
                 if q is not None:
                     term_queries.append(q)
             if term_queries:
-                table_queries.append(reduce(operator.or_, term_queries))
+                if not is_queryset(queryset):
+                    table_queries.append(reduce(operator.or_, term_queries))
+                elif self.config['search_strategy'] == 'union':
+                    table_queries.append(self.get_union_search_query(queryset, term_queries))
+                else:
+                    table_queries.append(self.get_plural_search_query(queryset, term_queries))
 
         if table_queries:
             q = reduce(operator.and_, table_queries)
@@ -470,60 +958,349 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
 
         return queryset
 
+    def get_union_search_query(self, queryset, queries):
+        """
+        Used by the ``'union'`` :py:attr:`search_strategy`.  Splits the ``OR`` of all the column
+        ``queries`` for one term into groups by the relationship path each condition joins through.
+        Each group becomes a separate ``pk`` subquery, and the subqueries are combined with
+        ``UNION`` so that each one can use the indexes on its own table instead of the database
+        scanning the product of every joined table.
+
+        Returns the ``Q`` object for the term, which is a plain ``OR`` if all of the conditions are
+        on the same table.
+        """
+        groups = self._group_search_conditions(queries)
+        if len(groups) == 1:
+            return self.get_plural_search_query(queryset, queries)
+
+        base_queryset = self.annotate_columns(queryset.model._base_manager.order_by())
+        subqueries = [base_queryset.filter(q).values('pk') for q in groups.values()]
+        if hasattr(base_queryset, 'union'):
+            return Q(pk__in=subqueries[0].union(*subqueries[1:]))
+        return reduce(operator.or_, [Q(pk__in=subquery) for subquery in subqueries])
+
+    def get_plural_search_query(self, queryset, queries):
+        """
+        Used by the default ``'or'`` :py:attr:`search_strategy`.  Returns the ``OR`` of all the
+        column ``queries`` for one term, except that the conditions on sources that span a
+        relationship to multiple items (a reverse ``ForeignKey`` or a ``ManyToManyField``) are
+        grouped by relationship and moved into a ``pk`` subquery per relationship.
+
+        Filtering across such a join directly makes the base queryset return one row per matching
+        related item, duplicating records in the page and inflating the counts.  The subquery is a
+        semi-join instead, so each record is matched at most once and counting and paging can stay
+        in the database.
+        """
+        base_queryset = self.annotate_columns(queryset.model._base_manager.order_by())
+        conditions = []
+        for path, q in self._group_search_conditions(queries).items():
+            if path and crosses_plural_relation(self.model, '%s__pk' % (path,)):
+                q = Q(pk__in=base_queryset.filter(q).values('pk'))
+            conditions.append(q)
+        return reduce(operator.or_, conditions)
+
+    def _group_search_conditions(self, queries):
+        """
+        Returns an ordered mapping of relationship paths to the ``OR`` of the conditions in
+        ``queries`` that join through each one.
+        """
+        groups = OrderedDict()
+        for q in queries:
+            for condition in self._split_or_query(q):
+                path = self._get_query_relation_path(condition)
+                groups.setdefault(path, []).append(condition)
+        return OrderedDict(
+            (path, reduce(operator.or_, conditions)) for path, conditions in groups.items()
+        )
+
+    def _split_or_query(self, q):
+        """ Returns the list of conditions that are ``OR``-ed together by ``q``. """
+        if q.connector != Q.OR or q.negated:
+            return [q]
+        conditions = []
+        for child in q.children:
+            if isinstance(child, Q):
+                conditions.extend(self._split_or_query(child))
+            else:
+                conditions.append(Q(**dict([child])))
+        return conditions
+
+    def _get_query_relation_path(self, q):
+        """ Returns the relationship path joined by the first condition in ``q``. """
+        child = q.children[0]
+        if isinstance(child, Q):
+            return self._get_query_relation_path(child)
+
+        model = self.model
+        path = []
+        for bit in child[0].split('__')[:-1]:
+            try:
+                model = get_model_at_related_field(model, bit)
+            except (FieldDoesNotExist, ValueError):
+                break
+            path.append(bit)
+        return '__'.join(path)
+
     def _search_column(self, column, terms):
         """ Requests search queries to be performed against the target column.  """
         return column.search(self.model, terms)
 
+    def get_search_plan(self, name, column):
+        """
+        Returns the column's compiled :py:meth:`~datatableview.columns.Column.get_search_plan`,
+        which is cached on the datatable class by model, column name and
+        :py:meth:`~datatableview.columns.Column.get_search_plan_key` so that sources, handlers,
+        lookup types and choices are only worked out once per process for each configuration of
+        the column.  The cached plan is rebound to ``column`` (and its nested columns), since each
+        datatable instance searches with its own copies.
+
+        Returns ``None`` when the plan can't be used: when the column class overrides
+        :py:meth:`~datatableview.columns.Column.search`, or when this class overrides
+        :py:meth:`._search_column`.  In that case the column is searched the long way.
+        """
+        if six.get_unbound_function(type(column).search) is not \
+                six.get_unbound_function(Column.search):
+            return None
+        if six.get_unbound_function(type(self)._search_column) is not \
+                six.get_unbound_function(Datatable._search_column):
+            return None
+
+        cls = type(self)
+        plans = cls.__dict__.get('_search_plans')
+        if plans is None:
+            plans = {}
+            cls._search_plans = plans
+
+        key = (self.model, name, column.get_search_plan_key())
+        try:
+            planned_column, plan = plans[key]
+        except TypeError:  # Unhashable configuration, such as a list inside an expression
+            return column.get_search_plan(self.model)
+        except KeyError:
+            plan = column.get_search_plan(self.model)
+            plans[key] = (column, plan)
+            return plan
+
+        if planned_column is column:
+            return plan
+        return bind_search_plan(plan, planned_column, column)
+
     def sort(self, queryset):
         """
         Performs db-only queryset sorts, then applies manual sorts if required.
         """
-        fields = []
         db, virtual = self.get_ordering_splits()
-        for name in db:
-            sort_direction = ''
-            if name[0] in '+-':
-                sort_direction = name[0]
-                if sort_direction == '+':
-                    sort_direction = ''
-                name = name[1:]
-            column = self.columns[name]
-            sources = column.get_sort_fields(self.model)
-            if sources:
-                fields.extend([(sort_direction + source) for source in sources])
-
-        object_list = queryset.order_by(*fields)
+        fields = self.get_keyset_ordering()
+        if fields is None:
+            fields = self.get_sort_fields(db)
 
         # When sorting a plural relationship field, we get duplicate rows for each item on the other
         # end of that relationship, which can't be removed with a call to distinct().
-        if self._force_distinct and contains_plural_field(self.model, fields):
+        distinct = self._force_distinct and contains_plural_field(self.model, fields)
+        if distinct and self.config['distinct_strategy'] == 'aggregate' and is_queryset(queryset):
+            aggregate_ordering = self.get_aggregate_ordering(queryset, fields)
+            if aggregate_ordering is not None:
+                queryset, fields = aggregate_ordering
+                distinct = False
+
+        object_list = queryset.order_by(*fields)
+
+        if (virtual or distinct) and self.config['sort_buffer_size'] \
+                and self.config['page_length'] != -1 and is_queryset(object_list):
+            key = self.get_virtual_sort_key(virtual) if virtual else None
+            return self.spill_sort(object_list, key=key, distinct=distinct)
+
+        if distinct:
             object_list = self.force_distinct(object_list)
 
         if virtual:
-            # Have to sort the whole queryset by hand!
-            object_list = list(object_list)
-
-            def flatten(value):
-                if isinstance(value, (list, tuple)):
-                    return flatten(value[0])
-                return value
-
-            for name in virtual[::-1]:  # stable sorting, top priority sort comes last
-                reverse = False
-                if name[0] in '+-':
-                    reverse = (name[0] == '-')
-                    name = name[1:]
-                column = self.columns[name]
-                object_list.sort(key=lambda o: flatten(column.value(o)[0]), reverse=reverse)
+            object_list = self.sort_virtual(object_list, virtual)
 
         return object_list
 
+    def get_aggregate_ordering(self, queryset, fields):
+        """
+        Removes the duplicate rows caused by ordering on plural relationships without leaving the
+        database.  Each plural ordering path is replaced by an annotation of its ``Min()`` (for
+        ascending order) or ``Max()`` (for descending order), which groups the results by object.
+        These are exactly the values that the first occurrence of each object would have been
+        sorted by, so the order matches manual duplicate removal while the queryset stays lazy.
+
+        Returns the 2-tuple of the annotated queryset and the new ordering fields, or ``None`` if
+        the queryset can't be deduplicated this way.
+        """
+        annotations = {}
+        ordering = []
+        for i, orm_path in enumerate(fields):
+            if not contains_plural_field(self.model, [orm_path]):
+                ordering.append(orm_path)
+                continue
+            descending = orm_path[0] == '-'
+            name = orm_path.lstrip('+-')
+            alias = 'datatableview_order_%d' % (i,)
+            annotations[alias] = Max(name) if descending else Min(name)
+            ordering.append(('-' if descending else '') + alias)
+        return queryset.annotate(**annotations), ordering
+
+    def get_virtual_sort_key(self, virtual):
+        """
+        Returns a key function for the ``virtual`` ordering names, producing a single
+        :py:class:`~datatableview.utils.CompositeSortKey` per object that respects each name's sort
+        direction.
+        """
+        def flatten(value):
+            if isinstance(value, (list, tuple)):
+                return flatten(value[0])
+            return value
+
+        sort_columns = []
+        reverses = []
+        for name in virtual:
+            reverse = False
+            if name[0] in '+-':
+                reverse = (name[0] == '-')
+                name = name[1:]
+            sort_columns.append(self.columns[name])
+            reverses.append(reverse)
+        reverses = tuple(reverses)
+
+        def get_key(obj):
+            values = tuple(flatten(column.value(obj)[0]) for column in sort_columns)
+            return CompositeSortKey(values, reverses)
+        return get_key
+
+    def sort_virtual(self, object_list, virtual):
+        """
+        Sorts ``object_list`` by hand according to the ``virtual`` ordering names.
+
+        When the response is paged, only the first ``start_offset + page_length`` objects can ever
+        be displayed, so a bounded heap selects just those, retaining that many objects instead of
+        the whole list.  The result is a list whose indexes still line up with the requested page.
+        """
+        key = self.get_virtual_sort_key(virtual)
+
+        if self.config['page_length'] == -1:
+            return sorted(object_list, key=key)
+
+        if is_queryset(object_list):
+            object_list = object_list.iterator()
+        limit = self.config['start_offset'] + self.config['page_length']
+        return heapq.nsmallest(limit, object_list, key=key)
+
+    def spill_sort(self, queryset, key=None, distinct=False):
+        """
+        Sorts and/or removes duplicates from ``queryset`` without holding its model instances in
+        memory, returning only the objects on the requested page.
+
+        The queryset is streamed, and each row is reduced to a compact ``(sort_key, position, pk)``
+        entry.  At most ``sort_buffer_size`` entries are kept in memory; each full buffer is sorted
+        and written to a temporary file as a run, and the runs are merged lazily.  No more than
+        ``SORT_MERGE_FAN_IN`` runs are merged at once; beyond that, groups of runs are first merged
+        into longer runs, so that the number of open files stays fixed however long the queryset.
+        When ``key`` is ``None`` the database order is already correct and only the ``distinct``
+        filtering happens.  Finally, the page's pks are hydrated with a single ``pk__in`` query.
+
+        The returned :py:class:`~datatableview.utils.OffsetList` can be sliced with the usual page
+        indexes.
+        """
+        buffer_size = self.config['sort_buffer_size']
+        i_begin = self.config['start_offset']
+        i_end = i_begin + self.config['page_length']
+
+        run_dir = None
+        run_files = []
+        try:
+            if key is None:
+                entries = ((None, i, pk) for i, pk in
+                           enumerate(queryset.values_list('pk', flat=True).iterator()))
+            else:
+                run_paths = []
+                run = []
+                for i, obj in enumerate(queryset.iterator()):
+                    run.append((key(obj), i, self.get_object_pk(obj)))
+                    if len(run) >= buffer_size:
+                        run.sort()
+                        if run_dir is None:
+                            run_dir = tempfile.mkdtemp(prefix='datatableview-sort-')
+                        run_paths.append(self._write_sort_run(run_dir, run))
+                        run = []
+                run.sort()
+                run_paths = self._merge_sort_runs(run_dir, run_paths)
+                run_files = [open(path, 'rb') for path in run_paths]
+                runs = [self._read_sort_run(f) for f in run_files]
+                entries = heapq.merge(*(runs + [iter(run)]))
+
+            seen = set()
+            position = 0
+            pks = []
+            for _, _, pk in entries:
+                if distinct:
+                    if pk in seen:
+                        continue
+                    seen.add(pk)
+                if position >= i_end:
+                    break
+                if position >= i_begin:
+                    pks.append(pk)
+                position += 1
+        finally:
+            for f in run_files:
+                f.close()
+            if run_dir is not None:
+                shutil.rmtree(run_dir, ignore_errors=True)
+
+        objects = {}
+        for obj in queryset.filter(pk__in=pks):
+            objects.setdefault(self.get_object_pk(obj), obj)
+        return OffsetList([objects[pk] for pk in pks if pk in objects], offset=i_begin)
+
+    def _write_sort_run(self, run_dir, entries):
+        """ Writes the sorted ``entries`` to a new file in ``run_dir``, returning its path. """
+        fd, path = tempfile.mkstemp(dir=run_dir)
+        with os.fdopen(fd, 'wb') as f:
+            for entry in entries:
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        return path
+
+    def _merge_sort_runs(self, run_dir, paths):
+        """
+        Merges the run files at ``paths`` into longer runs, ``SORT_MERGE_FAN_IN`` at a time, until
+        no more than ``SORT_MERGE_FAN_IN`` remain.  Returns the paths of the remaining runs.
+        """
+        while len(paths) > SORT_MERGE_FAN_IN:
+            merged = []
+            for i in range(0, len(paths), SORT_MERGE_FAN_IN):
+                group = paths[i:i + SORT_MERGE_FAN_IN]
+                if len(group) == 1:
+                    merged.append(group[0])
+                    continue
+                files = [open(path, 'rb') for path in group]
+                try:
+                    runs = [self._read_sort_run(f) for f in files]
+                    merged.append(self._write_sort_run(run_dir, heapq.merge(*runs)))
+                finally:
+                    for f in files:
+                        f.close()
+                for path in group:
+                    os.remove(path)
+            paths = merged
+        return paths
+
+    def _read_sort_run(self, f):
+        """ Yields the entries written by :py:meth:`._write_sort_run`, one at a time. """
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
     def force_distinct(self, object_list):
         seen = set()
         def is_unseen(obj):
-            if obj.pk in seen:
+            pk = self.get_object_pk(obj)
+            if pk in seen:
                 return False
-            seen.add(obj.pk)
+            seen.add(pk)
             return True
         return tuple(obj for obj in object_list if is_unseen(obj))
 
@@ -547,6 +1324,27 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
             kwargs.update(self.forward_callback_target.preload_record_data(obj))
         return kwargs
 
+    def preload_page_data(self, object_list):
+        """
+        An empty hook for doing something with the whole page of results before any of them are
+        processed.  The return value is a dict mapping each object's pk (as given by
+        :py:meth:`.get_object_pk`) to a dict of items that will be merged into that record's
+        :py:meth:`.preload_record_data` kwargs.  Items returned by :py:meth:`.preload_record_data`
+        win any name clashes.
+
+        Use this to look up expensive data for the entire page in one query (for example, with a
+        ``pk__in`` filter on the list of page pks) instead of once per record.
+
+        By default, this method also inspects the originating view for a method of the same name,
+        giving it an opportunity to contribute to the preloaded data.
+        """
+
+        data = {}
+        if self.forward_callback_target and \
+                getattr(self.forward_callback_target, 'preload_page_data', None):
+            data.update(self.forward_callback_target.preload_page_data(object_list))
+        return data
+
     def get_object_pk(self, obj):
         """ Returns the object's ``pk`` value. """
         return obj.pk
@@ -565,19 +1363,26 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
         and then sent to the column's :py:attr:`~datatableview.columns.Column.processor` function.
         """
 
+        pk = self.get_object_pk(obj)
         preloaded_kwargs = self.preload_record_data(obj)
+        if pk in self.preloaded_page_data:
+            preloaded_kwargs = dict(self.preloaded_page_data[pk], **preloaded_kwargs)
         data = {
-            'pk': self.get_object_pk(obj),
+            'pk': pk,
             '_extra_data': self.get_extra_record_data(obj),
         }
-        for i, (name, column) in enumerate(self.columns.items()):
-            kwargs = dict(column.get_processor_kwargs(**preloaded_kwargs), **{
-                'datatable': self,
-                'view': self.view,
-                'field_name': column.name,
-            })
-            value = self.get_column_value(obj, column, **kwargs)
-            processor = self.get_processor_method(column, i)
+
+        get_column_value = self.get_column_value
+        for key, column, processor, base_kwargs, get_processor_kwargs in self.get_row_renderer():
+            if get_processor_kwargs is not None:
+                kwargs = dict(get_processor_kwargs(**preloaded_kwargs), **base_kwargs)
+            elif preloaded_kwargs:
+                kwargs = dict(base_kwargs, **preloaded_kwargs)
+                kwargs.update(datatable=self, view=self.view, field_name=column.name)
+            else:
+                kwargs = base_kwargs
+
+            value = get_column_value(obj, column, **kwargs)
             if processor:
                 value = processor(obj, default_value=value[0], rich_value=value[1], **kwargs)
 
@@ -586,13 +1391,38 @@ class Datatable(six.with_metaclass(DatatableMetaclass)):
             if isinstance(value, (tuple, list)):
                 value = value[1]
 
-            if six.PY2 and isinstance(value, str):  # not unicode
-                value = value.decode('utf-8')
             if value is not None:
-                value = six.text_type(value)
-            data[str(i)] = value
+                value = coerce_text(value)
+            data[key] = value
         return data
 
+    def get_row_renderer(self):
+        """
+        Returns the list of per-column rendering instructions used by :py:meth:`get_record_data`,
+        compiled once per request so that each row only pays for its actual value lookups.  Each
+        item is a 5-tuple of the column's output key, the column, its resolved processor, the
+        constant processor kwargs, and the column's ``get_processor_kwargs`` method if a subclass
+        has overridden it (otherwise ``None``, since the default kwargs are constant).
+        """
+        if self._row_renderer is None:
+            renderer = []
+            for i, (name, column) in enumerate(self.columns.items()):
+                base_kwargs = {
+                    'datatable': self,
+                    'view': self.view,
+                    'field_name': column.name,
+                }
+                method = six.get_unbound_function(type(column).get_processor_kwargs)
+                if method is six.get_unbound_function(Column.get_processor_kwargs):
+                    get_processor_kwargs = None
+                    base_kwargs = dict(column.get_processor_kwargs(), **base_kwargs)
+                else:
+                    get_processor_kwargs = column.get_processor_kwargs
+                processor = self.get_processor_method(column, i)
+                renderer.append((str(i), column, processor, base_kwargs, get_processor_kwargs))
+            self._row_renderer = renderer
+        return self._row_renderer
+
     def get_column_value(self, obj, column, **kwargs):
         """ Returns whatever the column derived as the source value. """
         return column.value(obj, **kwargs)
@@ -702,7 +1532,7 @@ class ValuesDatatable(Datatable):
                 (source, name) for source in column.sources
             ]))
 
-        return queryset.values(*self.value_queries.keys())
+        return self.annotate_columns(queryset).values(*self.value_queries.keys())
 
     def populate_records(self):
         """
@@ -720,6 +1550,21 @@ class ValuesDatatable(Datatable):
         """
         return obj['pk']
 
+    def get_related_lookups(self):
+        """ Values querysets select their related data directly, so no lookups are required. """
+        return [], []
+
+    def get_only_fields(self):
+        """ Values querysets are already narrowed to the column sources. """
+        return None
+
+    def get_aggregate_ordering(self, queryset, fields):
+        """
+        Values querysets are grouped by their selected values rather than by object, and those
+        values may themselves span the plural relationship, so duplicates are removed manually.
+        """
+        return None
+
     def preload_record_data(self, obj):
         """
         Modifies the ``obj`` values dict to alias the selected values to the column name that asked
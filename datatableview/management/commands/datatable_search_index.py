@@ -0,0 +1,60 @@
+# -*- encoding: utf-8 -*-
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.module_loading import import_string
+
+from ...search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = ("Creates and fills the search index or search documents of each given Datatable "
+            "class, or refreshes them if they already exist.")
+
+    if django.VERSION < (1, 8):
+        args = '<datatable datatable ...>'
+        option_list = BaseCommand.option_list + (
+            make_option('--backend', default=None,
+                        help="Search backend name, instead of the datatable's search_backend."),
+            make_option('--database', default=DEFAULT_DB_ALIAS,
+                        help="Database to build the index in."),
+            make_option('--drop', action='store_true', default=False,
+                        help="Drop and recreate the index instead of refreshing its contents."),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('datatables', nargs='+', metavar='datatable',
+                            help="Dotted import path of a Datatable class.")
+        parser.add_argument('--backend', default=None,
+                            help="Search backend name, instead of the datatable's search_backend.")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help="Database to build the index in.")
+        parser.add_argument('--drop', action='store_true', default=False,
+                            help="Drop and recreate the index instead of refreshing its contents.")
+
+    def handle(self, *args, **options):
+        for path in options.get('datatables', args):
+            try:
+                datatable_class = import_string(path)
+            except ImportError as e:
+                raise CommandError("Unable to import %r: %s" % (path, e))
+            if datatable_class._meta.model is None:
+                raise CommandError("%s does not declare a Meta.model." % (path,))
+
+            datatable = datatable_class(datatable_class._meta.model._base_manager.none(), None)
+            backend = get_search_backend(options['backend'] or datatable._meta.search_backend)
+            try:
+                count = backend.build(datatable, using=options['database'], drop=options['drop'])
+            except ValueError as e:
+                raise CommandError(e)
+
+            if int(options['verbosity']) < 1:
+                continue
+            if count is None:
+                self.stdout.write("The %r search backend has no search index to build for %s" % (
+                    backend.name, path))
+            else:
+                self.stdout.write("Built the %r search index for %s from %d records" % (
+                    backend.name, path, count))
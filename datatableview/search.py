@@ -0,0 +1,506 @@
+# -*- encoding: utf-8 -*-
+"""
+Backends for the global search of a :py:class:`~datatableview.datatables.Datatable`.
+
+A backend's :py:meth:`~SearchBackend.search` is given the global search terms and returns the
+queryset narrowed to the records that match every term, or ``None`` to leave the terms to the
+columns, which build a ``Q`` object per term as usual.  Per-column searches are always handled by
+the columns themselves.
+
+Full-text backends keep one document per record in a shadow table next to the model's table.  The
+document is the text of every database-backed column source, including sources on related
+models.  These tables are not managed by migrations; they are created and filled with the
+``datatable_search_index`` management command, and kept current by calling the backend's
+:py:meth:`~IndexSearchBackend.update` for records that change.  The ``'document'`` backend instead
+stores the document in a field on the model and can keep it current through model signals.
+"""
+
+import operator
+from functools import reduce
+from itertools import groupby, islice
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Q, signals
+try:
+    from django.db.models import Case, Value, When
+except ImportError:  # Django < 1.8
+    Case = Value = When = None
+from django.db.models.fields import FieldDoesNotExist
+from django.utils.encoding import force_text
+
+import six
+
+from .compat import get_field
+from .utils import resolve_orm_path, get_model_at_related_field
+
+
+def get_search_index_name(datatable):
+    """
+    Returns the name of the table holding the search documents for ``datatable``, which is the
+    ``search_index`` ``Meta`` option if set, or else the model's table name suffixed with
+    ``_search``.  Datatables for the same model share an index unless they name their own.
+    """
+    return datatable._meta.search_index or '%s_search' % (datatable.model._meta.db_table,)
+
+
+def get_document_sources(datatable, exclude=()):
+    """
+    Returns the list of 2-tuples of ``(orm_path, choices)`` for every column source of
+    ``datatable`` that is backed by a model field, except those in ``exclude``.  ``choices`` maps
+    the field's stored values to their labels, so that documents can be found by either.
+    """
+    sources = []
+    for orm_path in datatable.get_column_orm_paths():
+        if orm_path in exclude:
+            continue
+        try:
+            field = resolve_orm_path(datatable.model, orm_path)
+        except (FieldDoesNotExist, ValueError):
+            continue
+        if orm_path in [source for source, _ in sources]:
+            continue
+        choices = dict(field.flatchoices) if getattr(field, 'choices', None) else {}
+        sources.append((orm_path, choices))
+    return sources
+
+
+def iter_documents(datatable, using=DEFAULT_DB_ALIAS, pks=None, exclude=()):
+    """
+    Yields 2-tuples of ``(pk, document)`` for every record of the datatable's model, or only those
+    in ``pks`` when given.  Sources spanning a plural relationship contribute the text of each
+    related item.  Sources in ``exclude`` are left out.
+    """
+    sources = get_document_sources(datatable, exclude=exclude)
+    queryset = datatable.model._base_manager.using(using).order_by('pk')
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    rows = queryset.values_list('pk', *[orm_path for orm_path, _ in sources]).iterator()
+
+    for pk, group in groupby(rows, key=lambda row: row[0]):
+        words = []
+        for row in group:
+            for (orm_path, choices), value in zip(sources, row[1:]):
+                if value is None or isinstance(value, bool):
+                    continue
+                for text in (force_text(value), force_text(choices.get(value, ''))):
+                    if text and text not in words:
+                        words.append(text)
+        yield pk, ' '.join(words)
+
+
+class SearchBackend(object):
+    """
+    Base backend, which leaves all terms to the columns.
+    """
+
+    name = None
+
+    def search(self, datatable, queryset, terms):
+        """
+        Returns ``queryset`` narrowed to the records matching every one of ``terms``, or ``None``
+        if the backend can't answer the search for this queryset.
+        """
+        return None
+
+    def build(self, datatable, using=DEFAULT_DB_ALIAS, drop=False):
+        """
+        Creates and fills the search index for ``datatable``, if the backend has one.  Returns the
+        number of documents written, or ``None`` if there is no index to build.
+        """
+
+    def update(self, datatable, pks, using=DEFAULT_DB_ALIAS):
+        """ Refreshes the indexed documents for the records in ``pks``. """
+
+
+class ORMSearchBackend(SearchBackend):
+    """
+    The default backend.  Every column builds its own ``Q`` object for each term, which are combined
+    according to the datatable's ``search_strategy``.
+    """
+
+    name = 'orm'
+
+
+class IndexSearchBackend(SearchBackend):
+    """
+    Base for backends that keep the documents in a shadow table of ``(pk, document)`` rows on a
+    particular database ``vendor``.  Searches against any other database fall back to the columns.
+    Subclasses provide the SQL.
+    """
+
+    vendor = None
+    chunk_size = 1000
+
+    def supports(self, connection):
+        return connection.vendor == self.vendor
+
+    def search(self, datatable, queryset, terms):
+        connection = connections[queryset.db]
+        if not self.supports(connection):
+            return None
+        qn = connection.ops.quote_name
+        opts = queryset.model._meta
+        pk = '%s.%s' % (qn(opts.db_table), qn(opts.pk.column))
+        where = self.get_search_sql(qn(get_search_index_name(datatable)), pk)
+        return queryset.extra(where=[where], params=self.get_search_params(terms))
+
+    def build(self, datatable, using=DEFAULT_DB_ALIAS, drop=False):
+        connection = self.get_connection(using)
+        table = connection.ops.quote_name(get_search_index_name(datatable))
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            if drop:
+                cursor.execute('DROP TABLE IF EXISTS %s' % (table,))
+            for sql in self.get_create_sql(connection, datatable, table):
+                cursor.execute(sql)
+            cursor.execute('DELETE FROM %s' % (table,))
+            return self.insert_documents(cursor, table, iter_documents(datatable, using))
+
+    def update(self, datatable, pks, using=DEFAULT_DB_ALIAS):
+        pks = list(pks)
+        if not pks:
+            return
+        connection = self.get_connection(using)
+        table = connection.ops.quote_name(get_search_index_name(datatable))
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(self.get_delete_sql(table, len(pks)), pks)
+            self.insert_documents(cursor, table, iter_documents(datatable, using, pks=pks))
+
+    def get_connection(self, using):
+        connection = connections[using]
+        if not self.supports(connection):
+            raise ValueError("The %r search backend requires a %s database, not %s." % (
+                self.name, self.vendor, connection.vendor))
+        return connection
+
+    def insert_documents(self, cursor, table, documents):
+        """
+        Writes the ``(pk, document)`` pairs from ``documents`` in chunks, returning how many were
+        written.
+        """
+        sql = self.get_insert_sql(table)
+        documents = iter(documents)
+        count = 0
+        while True:
+            chunk = [self.get_insert_params(pk, document)
+                     for pk, document in islice(documents, self.chunk_size)]
+            if not chunk:
+                return count
+            cursor.executemany(sql, chunk)
+            count += len(chunk)
+
+    def get_create_sql(self, connection, datatable, table):
+        """ Returns the list of statements that create the shadow table, if it doesn't exist. """
+        raise NotImplementedError
+
+    def get_delete_sql(self, table, count):
+        raise NotImplementedError
+
+    def get_insert_sql(self, table):
+        raise NotImplementedError
+
+    def get_insert_params(self, pk, document):
+        return [pk, document]
+
+    def get_search_sql(self, table, pk):
+        """ Returns the ``WHERE`` clause restricting the ``pk`` column to the matching documents. """
+        raise NotImplementedError
+
+    def get_search_params(self, terms):
+        raise NotImplementedError
+
+
+class FTS5SearchBackend(IndexSearchBackend):
+    """
+    SQLite's FTS5 extension.  Documents are stored in a virtual table whose ``rowid`` is the
+    record's ``pk``, so only models with integer primary keys are supported.  Each term is matched
+    as a token prefix, so ``"dja"`` finds ``"Django"`` but ``"ango"`` does not.
+    """
+
+    name = 'fts5'
+    vendor = 'sqlite'
+    tokenizer = 'unicode61'
+
+    def get_create_sql(self, connection, datatable, table):
+        return ["CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(document, tokenize = '%s')" % (
+            table, self.tokenizer)]
+
+    def get_delete_sql(self, table, count):
+        return 'DELETE FROM %s WHERE rowid IN (%s)' % (table, ', '.join(['%s'] * count))
+
+    def get_insert_sql(self, table):
+        return 'INSERT INTO %s (rowid, document) VALUES (%%s, %%s)' % (table,)
+
+    def get_search_sql(self, table, pk):
+        return '%s IN (SELECT rowid FROM %s WHERE %s MATCH %%s)' % (pk, table, table)
+
+    def get_search_params(self, terms):
+        return [' '.join('"%s"*' % (term.replace('"', '""'),) for term in terms)]
+
+
+class TSVectorSearchBackend(IndexSearchBackend):
+    """
+    PostgreSQL's ``tsvector`` type, stored in a table keyed by the record's ``pk`` with a GIN
+    index on the document.  Each term is matched as a lexeme prefix.  The text search
+    ``config`` defaults to ``'simple'``, which doesn't stem words, since search terms are often
+    partial words typed into the table's search box.
+    """
+
+    name = 'tsvector'
+    vendor = 'postgresql'
+
+    def __init__(self, config='simple'):
+        self.config = config
+
+    def get_create_sql(self, connection, datatable, table):
+        pk = datatable.model._meta.pk
+        pk_type = pk.rel_db_type(connection) if hasattr(pk, 'rel_db_type') else pk.db_type(connection)
+        index = connection.ops.quote_name('%s_document' % (get_search_index_name(datatable),))
+        return [
+            'CREATE TABLE IF NOT EXISTS %s (id %s PRIMARY KEY, document tsvector NOT NULL)' % (
+                table, pk_type),
+            'CREATE INDEX IF NOT EXISTS %s ON %s USING GIN (document)' % (index, table),
+        ]
+
+    def get_delete_sql(self, table, count):
+        return 'DELETE FROM %s WHERE id IN (%s)' % (table, ', '.join(['%s'] * count))
+
+    def get_insert_sql(self, table):
+        return 'INSERT INTO %s (id, document) VALUES (%%s, to_tsvector(%%s, %%s))' % (table,)
+
+    def get_insert_params(self, pk, document):
+        return [pk, self.config, document]
+
+    def get_search_sql(self, table, pk):
+        return '%s IN (SELECT id FROM %s WHERE document @@ to_tsquery(%%s, %%s))' % (pk, table)
+
+    def get_search_params(self, terms):
+        lexemes = ["'%s':*" % (term.replace('\\', '\\\\').replace("'", "''"),) for term in terms]
+        return [self.config, ' & '.join(lexemes)]
+
+
+class FullTextSearchBackend(SearchBackend):
+    """
+    Uses whichever of ``backends`` supports the database in use, falling back to the columns on
+    any other database, where :py:meth:`build` raises ``ValueError``.  By default this is FTS5 on
+    SQLite and ``tsvector`` on PostgreSQL.
+    """
+
+    name = 'fulltext'
+
+    def __init__(self, backends=None):
+        self.backends = [get_search_backend(backend)
+                         for backend in backends or (FTS5SearchBackend, TSVectorSearchBackend)]
+
+    def get_backend(self, using):
+        connection = connections[using]
+        for backend in self.backends:
+            if backend.supports(connection):
+                return backend
+        return None
+
+    def search(self, datatable, queryset, terms):
+        backend = self.get_backend(queryset.db)
+        if backend is None:
+            return None
+        return backend.search(datatable, queryset, terms)
+
+    def build(self, datatable, using=DEFAULT_DB_ALIAS, drop=False):
+        backend = self.get_backend(using)
+        if backend is None:
+            raise ValueError("The %r search backend supports %s databases, not %s." % (
+                self.name, ', '.join(other.vendor for other in self.backends),
+                connections[using].vendor))
+        return backend.build(datatable, using, drop=drop)
+
+    def update(self, datatable, pks, using=DEFAULT_DB_ALIAS):
+        backend = self.get_backend(using)
+        if backend is not None:
+            backend.update(datatable, pks, using)
+
+
+class DocumentSearchBackend(SearchBackend):
+    """
+    Searches a denormalized text ``field`` on the model itself, holding the lowercased document of
+    each record.  Each term becomes a single ``__contains`` condition on that field, instead of a
+    condition per column source across every joined table.  On PostgreSQL, a trigram index on the
+    field lets those conditions use an index.
+
+    :py:meth:`build` backfills the field for every record, writing up to ``chunk_size`` records per
+    ``UPDATE`` statement (one per record before Django 1.8), and :py:meth:`connect` keeps it current
+    as records and the related records in the document change.  Only one datatable per model
+    should be connected to the same field.
+    """
+
+    name = 'document'
+    chunk_size = 1000
+
+    def __init__(self, field='search_document'):
+        self.field = field
+
+    def search(self, datatable, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(**{'%s__contains' % (self.field,): term.lower()})
+        return queryset
+
+    def build(self, datatable, using=DEFAULT_DB_ALIAS, drop=False):
+        return self.write_documents(datatable, using)
+
+    def update(self, datatable, pks, using=DEFAULT_DB_ALIAS):
+        pks = list(pks)
+        if pks:
+            self.write_documents(datatable, using, pks=pks)
+
+    def write_documents(self, datatable, using, pks=None):
+        manager = datatable.model._base_manager.using(using)
+        field, _ = get_field(datatable.model._meta, self.field)
+        documents = iter_documents(datatable, using, pks=pks, exclude=[self.field])
+        # Each record takes a pk and a document in the CASE, and its pk again in the IN clause
+        batch_size = connections[using].ops.bulk_batch_size(['pk', field, 'pk'],
+                                                            range(self.chunk_size))
+        count = 0
+        with transaction.atomic(using=using):
+            while True:
+                chunk = list(islice(documents, min(batch_size, self.chunk_size)))
+                if not chunk:
+                    return count
+                if Case is None:
+                    for pk, document in chunk:
+                        manager.filter(pk=pk).update(**{self.field: document.lower()})
+                else:
+                    manager.filter(pk__in=[pk for pk, _ in chunk]).update(**{self.field: Case(
+                        *[When(pk=pk, then=Value(document.lower())) for pk, document in chunk],
+                        output_field=field
+                    )})
+                count += len(chunk)
+
+    def connect(self, datatable_class):
+        """
+        Connects signal receivers that call :py:meth:`update` for the records whose document is
+        affected when an instance of the model, or of any model along the relationship paths of
+        its sources, is saved or deleted, or when one of those ``ManyToManyField`` relationships
+        changes.  Call this once, for example from ``AppConfig.ready()``.  Returns the
+        :py:class:`DocumentReceiver`, whose ``disconnect()`` removes the receivers again.
+        """
+        model = datatable_class._meta.model
+        paths = {model: ['']}
+        throughs = set()
+        datatable = datatable_class(model._base_manager.none(), None)
+        for orm_path, _ in get_document_sources(datatable, exclude=[self.field]):
+            related_model = model
+            bits = orm_path.split('__')[:-1]
+            for i, bit in enumerate(bits):
+                field, _ = get_field(related_model._meta, bit)
+                related_model = get_model_at_related_field(related_model, bit)
+                path = '__'.join(bits[:i + 1])
+                if path not in paths.setdefault(related_model, []):
+                    paths[related_model].append(path)
+                through = getattr(field, 'through', None) or getattr(
+                    getattr(field, 'remote_field', None) or getattr(field, 'rel', None),
+                    'through', None)
+                if through is not None:
+                    throughs.add(through)
+
+        receiver = DocumentReceiver(self, datatable_class, paths, throughs)
+        receiver.connect()
+        return receiver
+
+
+class DocumentReceiver(object):
+    """
+    Signal receivers for :py:meth:`DocumentSearchBackend.connect`.  ``paths`` maps each model
+    class to the ORM paths that lead to it from the datatable's model.  The records affected by a
+    change are looked up both before and after it, so that records losing a relationship are
+    updated as well as those gaining one.
+    """
+
+    instance_signals = (signals.pre_save, signals.post_save, signals.pre_delete, signals.post_delete)
+
+    def __init__(self, backend, datatable_class, paths, throughs):
+        self.backend = backend
+        self.datatable_class = datatable_class
+        self.paths = paths
+        self.throughs = throughs
+        self.model = datatable_class._meta.model
+        self.attname = '_datatableview_search_pks_%d' % (id(self),)
+        self.dispatch_uid = 'datatableview.search.%s.%s' % (datatable_class.__module__,
+                                                            datatable_class.__name__)
+
+    def get_dispatch_uid(self, sender):
+        return '%s.%s.%s' % (self.dispatch_uid, sender._meta.app_label, sender._meta.model_name)
+
+    def connect(self):
+        for sender in self.paths:
+            for signal in self.instance_signals:
+                signal.connect(self.instance_changed, sender=sender, weak=False,
+                               dispatch_uid=self.get_dispatch_uid(sender))
+        for sender in self.throughs:
+            signals.m2m_changed.connect(self.m2m_changed, sender=sender, weak=False,
+                                        dispatch_uid=self.get_dispatch_uid(sender))
+
+    def disconnect(self):
+        for sender in self.paths:
+            for signal in self.instance_signals:
+                signal.disconnect(sender=sender, dispatch_uid=self.get_dispatch_uid(sender))
+        for sender in self.throughs:
+            signals.m2m_changed.disconnect(sender=sender,
+                                           dispatch_uid=self.get_dispatch_uid(sender))
+
+    def get_affected_pks(self, model, pks, using):
+        affected = set()
+        queries = []
+        for path in self.paths.get(model, []):
+            if path:
+                queries.append(Q(**{'%s__pk__in' % (path,): pks}))
+            else:
+                affected.update(pks)
+        if queries:
+            queryset = self.model._base_manager.using(using).filter(reduce(operator.or_, queries))
+            affected.update(queryset.values_list('pk', flat=True))
+        return affected
+
+    def update(self, instance, pks, using, signal_name):
+        if signal_name.startswith('pre_'):
+            setattr(instance, self.attname, pks)
+            return
+        pks = pks | instance.__dict__.pop(self.attname, set())
+        if pks:
+            datatable = self.datatable_class(self.model._base_manager.none(), None)
+            self.backend.update(datatable, pks, using)
+
+    def instance_changed(self, signal, sender, instance, using=None, raw=False, **kwargs):
+        if raw or instance.pk is None:
+            return
+        pks = self.get_affected_pks(sender, [instance.pk], using)
+        signal_name = 'pre_save' if signal is signals.pre_save else \
+                      'pre_delete' if signal is signals.pre_delete else 'post'
+        self.update(instance, pks, using, signal_name)
+
+    def m2m_changed(self, sender, instance, action, model, pk_set, using=None, **kwargs):
+        pks = self.get_affected_pks(type(instance), [instance.pk], using)
+        if pk_set:
+            pks |= self.get_affected_pks(model, list(pk_set), using)
+        self.update(instance, pks, using, action)
+
+
+# Names usable for the ``search_backend`` Meta option.
+SEARCH_BACKENDS = {
+    ORMSearchBackend.name: ORMSearchBackend,
+    FTS5SearchBackend.name: FTS5SearchBackend,
+    TSVectorSearchBackend.name: TSVectorSearchBackend,
+    FullTextSearchBackend.name: FullTextSearchBackend,
+    DocumentSearchBackend.name: DocumentSearchBackend,
+}
+
+def get_search_backend(backend):
+    """
+    Normalizes ``backend`` to a :py:class:`SearchBackend` instance.  A registered name from
+    ``SEARCH_BACKENDS``, a backend class, or a configured instance are all accepted.
+    """
+    if isinstance(backend, six.string_types):
+        try:
+            backend = SEARCH_BACKENDS[backend]
+        except KeyError:
+            raise ValueError("Unknown search backend %r." % (backend,))
+    if isinstance(backend, type):
+        backend = backend()
+    return backend
@@ -105,10 +105,24 @@ var datatableview = {
                 sorting_options[i] = sorting_options[i].slice(1);
             }
 
+            var keyset_cursor = null;
             options = $.extend({}, datatableview.defaults, opts, {
                 "order": sorting_options,
                 "columns": column_options,
-                "ajax": datatable.attr('data-source-url'),
+                "ajax": {
+                    "url": datatable.attr('data-source-url'),
+                    "data": function(data){
+                        // Echo the keyset pagination cursor from the previous response.  The
+                        // server only seeks with it when it matches the requested page.
+                        if (keyset_cursor) {
+                            data.cursor = keyset_cursor;
+                        }
+                    },
+                    "dataSrc": function(json){
+                        keyset_cursor = json.cursor || null;
+                        return json.data;
+                    }
+                },
                 "pageLength": datatable.attr('data-page-length'),
                 "infoCallback": function(oSettings, iStart, iEnd, iMax, iTotal, sPre){
                     $("#" + datatable.attr('data-result-counter-id')).html(parseInt(iTotal).toLocaleString());
@@ -39,3 +39,10 @@ class RelatedM2MModel(models.Model):
 class ReverseRelatedModel(models.Model):
     name = models.CharField(max_length=15)
     example = models.ForeignKey('ExampleModel')
+
+
+class SearchDocumentModel(models.Model):
+    name = models.CharField(max_length=15)
+    related = models.ForeignKey('RelatedModel', blank=True, null=True)
+    relateds = models.ManyToManyField('RelatedM2MModel', blank=True)
+    search_document = models.TextField(blank=True, default='')
@@ -1,7 +1,13 @@
 # -*- encoding: utf-8 -*-
+from datetime import date, datetime
+
+from django.utils.timezone import utc
+
 from .testcase import DatatableViewTestCase
 from .test_app import models
-from ..columns import Column, COLUMN_CLASSES
+from ..columns import (Column, DateTimeColumn, COLUMN_CLASSES, parse_date_period,
+                       parse_date_range)
+from ..datatables import Datatable
 from ..exceptions import ColumnError
 from .. import utils
 
@@ -43,3 +49,61 @@ class ColumnTests(DatatableViewTestCase):
         column = Column(sources=['fake1', 'fake2'], processor=processor)
         column.value(obj)
         self.assertEqual(processed, [])
+
+    def test_parse_date_period(self):
+        self.assertEqual(parse_date_period('2017'), (date(2017, 1, 1), date(2018, 1, 1), 'year'))
+        self.assertEqual(parse_date_period('2017-12'), (date(2017, 12, 1), date(2018, 1, 1), 'month'))
+        self.assertEqual(parse_date_period('2017/02/28'), (date(2017, 2, 28), date(2017, 3, 1), 'day'))
+        self.assertEqual(parse_date_period('2017-02-30'), None)
+        self.assertEqual(parse_date_period('Feb 2017'), None)
+        self.assertEqual(parse_date_range('2017-01 .. 2017-03'), (date(2017, 1, 1), date(2017, 4, 1)))
+        self.assertEqual(parse_date_range('2018 to 2017'), None)
+
+    def test_date_search_uses_ranges(self):
+        obj1 = models.ExampleModel.objects.create(name="test name 1")
+        obj2 = models.ExampleModel.objects.create(name="test name 2")
+        models.ExampleModel.objects.filter(pk=obj1.pk).update(
+            date_created=datetime(2017, 5, 4, 23, 30, tzinfo=utc))
+        models.ExampleModel.objects.filter(pk=obj2.pk).update(
+            date_created=datetime(2018, 1, 1, tzinfo=utc))
+        queryset = models.ExampleModel.objects.all()
+
+        column = DateTimeColumn("Created", sources=['date_created'])
+        q = column.search(models.ExampleModel, '2017')
+        self.assertNotIn('date_created__year', str(q))
+        self.assertEqual(list(queryset.filter(q)), [obj1])
+
+        for term, expected in [('2017-05', [obj1]), ('2017-05-04', [obj1]), ('2017-05-05', []),
+                               ('2017-05 .. 2018-01', [obj1, obj2]), ('2018', [obj2])]:
+            q = column.search(models.ExampleModel, term)
+            self.assertEqual(list(queryset.filter(q)), expected, term)
+
+    def test_date_prep_search_value(self):
+        # 'exact' still coerces to a date; only get_search_query() turns it into a range
+        column = DateTimeColumn("Created", sources=['date_created'])
+        self.assertEqual(column.prep_search_value('2017-05-04', 'exact'), date(2017, 5, 4))
+        self.assertEqual(column.prep_search_value('2017-05', 'exact'), None)
+        self.assertEqual(column.prep_search_value('2017-05', 'range'),
+                         (date(2017, 5, 1), date(2017, 6, 1)))
+        q = column.get_search_query('date_created', 'exact', date(2017, 5, 4))
+        self.assertNotIn('date_created__exact', str(q))
+
+    def test_date_range_terms_in_search_string(self):
+        obj1 = models.ExampleModel.objects.create(name="test name 1")
+        obj2 = models.ExampleModel.objects.create(name="test name 2")
+        models.ExampleModel.objects.filter(pk=obj1.pk).update(
+            date_created=datetime(2017, 5, 4, tzinfo=utc))
+        models.ExampleModel.objects.filter(pk=obj2.pk).update(
+            date_created=datetime(2018, 1, 1, tzinfo=utc))
+        queryset = models.ExampleModel.objects.all()
+
+        class DT(Datatable):
+            class Meta:
+                model = models.ExampleModel
+                columns = ['date_created']
+
+        # Search strings are split on spaces, so spaced ranges must be quoted
+        for search in ['2017-05..2017-12', '"2017-05 .. 2017-12"', "'2017 to 2017'"]:
+            dt = DT(queryset, '/', query_config={'search[value]': search})
+            dt.populate_records()
+            self.assertEqual(list(dt._records), [obj1], search)
@@ -0,0 +1,240 @@
+# -*- encoding: utf-8 -*-
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import signals
+from django.db.models.deletion import Collector
+
+from .testcase import DatatableViewTestCase
+from .test_app import models
+from ..datatables import Datatable
+from ..views import DatatableJSONResponseMixin
+from .. import counts
+
+
+class CountStrategyTests(DatatableViewTestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(5):
+            models.ExampleModel.objects.create(name="test name %d" % (i,))
+
+    def test_get_count_strategy(self):
+        self.assertIsInstance(counts.get_count_strategy('exact'), counts.ExactCount)
+        self.assertIsInstance(counts.get_count_strategy(counts.CappedCount), counts.CappedCount)
+        strategy = counts.CappedCount(cap=2)
+        self.assertIs(counts.get_count_strategy(strategy), strategy)
+        with self.assertRaises(ValueError):
+            counts.get_count_strategy('fake')
+
+    def test_non_queryset_uses_len(self):
+        self.assertEqual(counts.CappedCount(cap=1).count([1, 2, 3]), (3, 'exact'))
+
+    def test_exact_count(self):
+        queryset = models.ExampleModel.objects.all()
+        self.assertEqual(counts.ExactCount().count(queryset), (5, 'exact'))
+
+    def test_capped_count(self):
+        queryset = models.ExampleModel.objects.all()
+        self.assertEqual(counts.CappedCount(cap=3).count(queryset), (3, 'capped'))
+        self.assertEqual(counts.CappedCount(cap=5).count(queryset), (5, 'exact'))
+
+    def test_estimated_count_falls_back_to_exact(self):
+        queryset = models.ExampleModel.objects.all()
+        self.assertEqual(counts.EstimatedCount(threshold=0).count(queryset), (5, 'exact'))
+
+    def test_empty_querysets_count_zero(self):
+        for queryset in [models.ExampleModel.objects.none(),
+                         models.ExampleModel.objects.filter(pk__in=[])]:
+            self.assertEqual(counts.ExactCount().count(queryset), (0, 'exact'))
+            self.assertEqual(counts.CappedCount(cap=3).count(queryset), (0, 'exact'))
+            self.assertEqual(counts.EstimatedCount(threshold=0).count(queryset), (0, 'exact'))
+            self.assertEqual(counts.CachedCount().count(queryset), (0, 'exact'))
+
+        class DT(Datatable):
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name']
+                count_strategy = 'cached'
+                total_count_strategy = 'cached'
+
+        dt = DT(models.ExampleModel.objects.none(), '/')
+        dt.populate_records()
+        self.assertEqual((dt.total_initial_record_count, dt.unpaged_record_count), (0, 0))
+
+    def test_estimated_count_of_empty_queryset_skips_planner(self):
+        # The planner is only asked on postgresql, but an empty queryset never reaches it
+        connection = connections[models.ExampleModel.objects.db]
+        connection.vendor = 'postgresql'
+        try:
+            strategy = counts.EstimatedCount(threshold=0)
+            queryset = models.ExampleModel.objects.filter(pk__in=[])
+            self.assertIsNone(strategy.get_estimate(queryset))
+            self.assertEqual(strategy.count(queryset), (0, 'exact'))
+        finally:
+            del connection.vendor
+
+    def test_cached_count(self):
+        queryset = models.ExampleModel.objects.all()
+        strategy = counts.CachedCount()
+        self.assertEqual(strategy.count(queryset), (5, 'exact'))
+        self.assertEqual(strategy.count(queryset), (5, 'cached'))
+
+        # Different SQL is a different cache entry
+        queryset = models.ExampleModel.objects.filter(name__startswith="test")
+        self.assertEqual(strategy.count(queryset), (5, 'exact'))
+
+    def test_cached_count_invalidation(self):
+        queryset = models.ExampleModel.objects.all()
+        strategy = counts.CachedCount()
+        self.assertEqual(strategy.count(queryset), (5, 'exact'))
+
+        # Saving or deleting an instance moves the table to a new generation
+        instance = models.ExampleModel.objects.create(name="new")
+        self.assertEqual(strategy.count(queryset), (6, 'exact'))
+        instance.delete()
+        self.assertEqual(strategy.count(queryset), (5, 'exact'))
+        self.assertEqual(strategy.count(queryset), (5, 'cached'))
+
+        # Writes to unrelated tables don't
+        models.RelatedModel.objects.create(name="unrelated")
+        self.assertEqual(strategy.count(queryset), (5, 'cached'))
+
+        # Bulk operations send no signals and are invalidated by hand
+        models.ExampleModel.objects.bulk_create([models.ExampleModel(name="bulk")])
+        self.assertEqual(strategy.count(queryset), (5, 'cached'))
+        counts.invalidate_counts(models.ExampleModel)
+        self.assertEqual(strategy.count(queryset), (6, 'exact'))
+
+        # Joined and subquery tables are tracked too
+        related = models.RelatedM2MModel.objects.create(name="related")
+        queryset = models.ExampleModel.objects.filter(relateds__name="related")
+        subquery = models.ExampleModel.objects.filter(
+            pk__in=models.ExampleModel.objects.filter(relateds__name="related").values('pk'))
+        self.assertEqual(strategy.count(queryset), (0, 'exact'))
+        self.assertEqual(strategy.count(subquery), (0, 'exact'))
+        instance = models.ExampleModel.objects.first()
+        instance.relateds.add(related)
+        self.assertEqual(strategy.count(queryset), (1, 'exact'))
+        self.assertEqual(strategy.count(subquery), (1, 'exact'))
+
+    def test_cached_count_tracks_only_counted_models(self):
+        counts.CachedCount().count(models.ExampleModel.objects.filter(relateds__name="related"))
+        self.assertTrue(signals.post_save.has_listeners(models.ExampleModel))
+        self.assertTrue(signals.m2m_changed.has_listeners(models.ExampleModel.relateds.through))
+
+        # Models that are never counted keep Django's fast-path deletes
+        self.assertFalse(signals.post_delete.has_listeners(models.ReverseRelatedModel))
+        queryset = models.ReverseRelatedModel.objects.all()
+        self.assertTrue(Collector(using=queryset.db).can_fast_delete(queryset))
+
+    def test_cached_total_survives_page_changes(self):
+        class DT(Datatable):
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name']
+                total_count_strategy = 'cached'
+                page_length = 2
+
+        queryset = models.ExampleModel.objects.all()
+        DT(queryset, '/').populate_records()
+
+        for config in ({'displayStart': '2'}, {'order[0][column]': '0', 'order[0][dir]': 'desc'}):
+            dt = DT(queryset, '/', query_config=config)
+            with self.assertNumQueries(1):
+                dt.populate_records()
+            self.assertEqual((dt.total_initial_record_count, dt.total_initial_record_count_strategy),
+                             (5, 'cached'))
+
+    def test_datatable_meta_strategies(self):
+        class DT(Datatable):
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name']
+                count_strategy = counts.CappedCount(cap=1)
+                total_count_strategy = 'exact'
+
+        queryset = models.ExampleModel.objects.all()
+        dt = DT(queryset, '/', query_config={'search[value]': 'test'})
+        dt.populate_records()
+        self.assertEqual(dt.total_initial_record_count, 5)
+        self.assertEqual(dt.total_initial_record_count_strategy, 'exact')
+        self.assertEqual(dt.unpaged_record_count, 1)
+        self.assertEqual(dt.unpaged_record_count_strategy, 'capped')
+
+    def test_window_count(self):
+        class DT(Datatable):
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name']
+                count_strategy = 'window'
+                page_length = 2
+
+        queryset = models.ExampleModel.objects.all()
+        if not counts.supports_window_functions(connections[queryset.db]):
+            self.skipTest("The database or Django version has no window functions")
+
+        # Unfiltered, the page query provides both counts
+        dt = DT(queryset, '/')
+        with self.assertNumQueries(1):
+            dt.populate_records()
+            self.assertEqual(len(dt.get_records()), 2)
+        self.assertEqual((dt.unpaged_record_count, dt.unpaged_record_count_strategy), (5, 'window'))
+        self.assertEqual((dt.total_initial_record_count, dt.total_initial_record_count_strategy),
+                         (5, 'window'))
+
+        # A search needs the total counted on its own
+        dt = DT(queryset, '/', query_config={'search[value]': 'name 1'})
+        with self.assertNumQueries(2):
+            dt.populate_records()
+            dt.get_records()
+        self.assertEqual((dt.unpaged_record_count, dt.unpaged_record_count_strategy), (1, 'window'))
+        self.assertEqual((dt.total_initial_record_count, dt.total_initial_record_count_strategy),
+                         (5, 'exact'))
+
+        # An empty page past the end can't tell how many results there are
+        dt = DT(queryset, '/', query_config={'displayStart': '10'})
+        dt.populate_records()
+        self.assertEqual(dt.get_records(), [])
+        self.assertEqual((dt.unpaged_record_count, dt.unpaged_record_count_strategy), (5, 'exact'))
+
+        dt = DT(queryset, '/', query_config={'search[value]': 'nothing'})
+        dt.populate_records()
+        self.assertEqual(dt.get_records(), [])
+        self.assertEqual((dt.unpaged_record_count, dt.unpaged_record_count_strategy), (0, 'window'))
+
+        # Unpaged requests are counted up front
+        dt = DT(queryset, '/', query_config={'pageLength': '-1'})
+        dt.populate_records()
+        self.assertEqual((dt.unpaged_record_count, dt.unpaged_record_count_strategy), (5, 'exact'))
+
+        # The JSON response reads the records before the counts
+        class FakeRequest(object):
+            GET = {}
+
+        view = DatatableJSONResponseMixin()
+        view.request = FakeRequest()
+        data = view.get_json_response_object(DT(queryset, '/'))
+        self.assertEqual((data['recordsTotal'], data['recordsFiltered']), (5, 5))
+        self.assertEqual(data['countStrategies'], {'recordsTotal': 'window', 'recordsFiltered': 'window'})
+
+    def test_json_response_reports_strategies(self):
+        class DT(Datatable):
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name']
+                total_count_strategy = 'cached'
+
+        class FakeRequest(object):
+            GET = {'search[value]': 'name 1'}
+
+        view = DatatableJSONResponseMixin()
+        view.request = FakeRequest()
+        queryset = models.ExampleModel.objects.all()
+
+        data = view.get_json_response_object(DT(queryset, '/', query_config=FakeRequest.GET))
+        self.assertEqual(data['recordsTotal'], 5)
+        self.assertEqual(data['recordsFiltered'], 1)
+        self.assertEqual(data['countStrategies'], {'recordsTotal': 'exact', 'recordsFiltered': 'exact'})
+
+        data = view.get_json_response_object(DT(queryset, '/', query_config=FakeRequest.GET))
+        self.assertEqual(data['countStrategies'], {'recordsTotal': 'cached', 'recordsFiltered': 'exact'})
@@ -1,5 +1,19 @@
 # -*- encoding: utf-8 -*-
+import os
+import tempfile
+import threading
 from inspect import isgenerator
+from unittest import skipIf
+
+import django
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.models import Q, F, CharField, Count
+try:
+    from django.db.models import Value
+    from django.db.models.functions import Concat
+except ImportError:  # Django < 1.8
+    Value = Concat = None
 
 from .testcase import DatatableViewTestCase
 from .test_app import models
@@ -7,6 +21,8 @@ from ..exceptions import ColumnError
 from ..datatables import Datatable, ValuesDatatable
 from ..views import DatatableJSONResponseMixin, DatatableView
 from .. import columns
+from .. import counts
+from .. import datatables
 
 class DatatableTests(DatatableViewTestCase):
     def test_normalize_config(self):
@@ -104,6 +120,23 @@ class DatatableTests(DatatableViewTestCase):
         dt.configure()
         self.assertEqual(dt.get_ordering_splits(), ([], ['fake', 'name']))
 
+    def test_instances_do_not_share_column_state(self):
+        class DT(Datatable):
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'value']
+
+        dt1 = DT([], '/', query_config={'order[0][column]': '1', 'order[0][dir]': 'desc'})
+        dt1.configure()
+        dt2 = DT([], '/', query_config={'order[0][column]': '0', 'order[0][dir]': 'asc'})
+        dt2.configure()
+
+        self.assertEqual(dt1.columns['value'].sort_direction, 'desc')
+        self.assertEqual(dt2.columns['value'].sort_direction, None)
+        self.assertEqual(dt2.columns['name'].sort_direction, 'asc')
+        self.assertEqual(DT.base_columns['value'].sort_direction, None)
+        self.assertIs(dt1.columns['name'].sources, DT.base_columns['name'].sources)
+
     def test_get_records_populates_cache(self):
         models.ExampleModel.objects.create(name="test name")
         queryset = models.ExampleModel.objects.all()
@@ -186,6 +219,37 @@ class DatatableTests(DatatableViewTestCase):
             dt.get_records()
         self.assertEqual(str(cm.exception), "We did it")
 
+    def test_preload_page_data_runs_once_per_page(self):
+        obj1 = models.ExampleModel.objects.create(name="test name 1")
+        obj2 = models.ExampleModel.objects.create(name="test name 2")
+        queryset = models.ExampleModel.objects.all()
+
+        class Dummy(object):
+            calls = []
+
+            def preload_page_data(self, object_list):
+                self.calls.append(list(object_list))
+                return {obj.pk: {'label': 'row %d' % obj.pk} for obj in object_list}
+
+            def preload_record_data(self, obj):
+                return {}
+
+            def get_label(self, obj, **kwargs):
+                return kwargs['label']
+
+        class DT(Datatable):
+            label = columns.TextColumn("Label", sources=None, processor='get_label')
+
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'label']
+
+        view = Dummy()
+        dt = DT(queryset, '/', callback_target=view)
+        data = dt.get_records()
+        self.assertEqual(view.calls, [[obj1, obj2]])
+        self.assertEqual([row['1'] for row in data], ['row %d' % obj1.pk, 'row %d' % obj2.pk])
+
     def test_sort_defaults_to_meta_ordering(self):
         # Defined so that 'pk' order != 'name' order
         obj1 = models.ExampleModel.objects.create(name="b")
@@ -365,6 +429,184 @@ class DatatableTests(DatatableViewTestCase):
         self.assertEqual(dt.get_ordering_splits(), ([], ['-pk']))
         self.assertEqual(list(dt._records), [obj1, obj2, obj3])
 
+    def test_sort_virtual_keeps_only_visible_rows(self):
+        objects = [models.ExampleModel.objects.create(name=name) for name in "abcde"]
+        queryset = models.ExampleModel.objects.all()
+
+        class DT(Datatable):
+            pk = columns.TextColumn("Data", sources=['get_negative_pk'])
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'pk']
+                page_length = 2
+
+        dt = DT(queryset, '/', query_config={'order[0][column]': '1', 'order[0][dir]': 'asc',
+                                             'displayStart': '2'})
+        dt.populate_records()
+        self.assertEqual(dt.unpaged_record_count, 5)
+        self.assertEqual(list(dt._records), objects[::-1][:4])
+        self.assertEqual([r['0'] for r in dt.get_records()], ['c', 'b'])
+
+    def test_sort_virtual_spills_to_disk(self):
+        objects = [models.ExampleModel.objects.create(name=name) for name in "abcde"]
+        queryset = models.ExampleModel.objects.all()
+
+        class DT(Datatable):
+            pk = columns.TextColumn("Data", sources=['get_negative_pk'])
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'pk']
+                page_length = 2
+                sort_buffer_size = 2
+
+        dt = DT(queryset, '/', query_config={'order[0][column]': '1', 'order[0][dir]': 'asc',
+                                             'displayStart': '2'})
+        dt.populate_records()
+        self.assertEqual(list(dt._records), [objects[2], objects[1]])
+        self.assertEqual([r['0'] for r in dt.get_records()], ['c', 'b'])
+
+        dt = DT(queryset, '/', query_config={'order[0][column]': '1', 'order[0][dir]': 'desc',
+                                             'displayStart': '4'})
+        self.assertEqual([r['0'] for r in dt.get_records()], ['e'])
+
+    def test_spill_sort_bounds_merge_fan_in(self):
+        objects = [models.ExampleModel.objects.create(name=name) for name in "abcdefghi"]
+        queryset = models.ExampleModel.objects.all()
+        merged_runs = []
+
+        class DT(Datatable):
+            pk = columns.TextColumn("Data", sources=['get_negative_pk'])
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'pk']
+                page_length = 3
+                sort_buffer_size = 1
+
+            def _merge_sort_runs(self, run_dir, paths):
+                paths = super(DT, self)._merge_sort_runs(run_dir, paths)
+                merged_runs.append(len(paths))
+                return paths
+
+        fan_in = datatables.SORT_MERGE_FAN_IN
+        datatables.SORT_MERGE_FAN_IN = 2
+        try:
+            dt = DT(queryset, '/', query_config={'order[0][column]': '1', 'order[0][dir]': 'asc',
+                                                 'displayStart': '3'})
+            dt.populate_records()
+        finally:
+            datatables.SORT_MERGE_FAN_IN = fan_in
+        self.assertEqual(merged_runs, [2])
+        self.assertEqual(list(dt._records), objects[::-1][3:6])
+
+    def test_spill_sort_removes_duplicates(self):
+        m2m_a = models.RelatedM2MModel.objects.create(name="a")
+        m2m_b = models.RelatedM2MModel.objects.create(name="b")
+        obj1 = models.ExampleModel.objects.create(name="1")
+        obj2 = models.ExampleModel.objects.create(name="2")
+        obj1.relateds.add(m2m_a, m2m_b)
+        obj2.relateds.add(m2m_b)
+        queryset = models.ExampleModel.objects.all()
+
+        class DT(Datatable):
+            related = columns.TextColumn("Related", sources=['relateds__name'])
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'related']
+                sort_buffer_size = 1
+                distinct_strategy = 'python'
+
+        dt = DT(queryset, '/', query_config={'order[0][column]': '1', 'order[0][dir]': 'desc'})
+        dt.populate_records()
+        self.assertEqual(list(dt._records), [obj1, obj2])
+
+    def test_sort_plural_field_deduplicates_in_database(self):
+        m2m_a = models.RelatedM2MModel.objects.create(name="a")
+        m2m_b = models.RelatedM2MModel.objects.create(name="b")
+        m2m_c = models.RelatedM2MModel.objects.create(name="c")
+        obj1 = models.ExampleModel.objects.create(name="1")
+        obj2 = models.ExampleModel.objects.create(name="2")
+        obj1.relateds.add(m2m_a, m2m_c)
+        obj2.relateds.add(m2m_b)
+        queryset = models.ExampleModel.objects.all()
+
+        class DT(Datatable):
+            related = columns.TextColumn("Related", sources=['relateds__name'])
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'related']
+
+        dt = DT(queryset, '/', query_config={'order[0][column]': '1', 'order[0][dir]': 'asc'})
+        dt.populate_records()
+        self.assertEqual(dt._records.count(), 2)
+        self.assertEqual(list(dt._records), [obj1, obj2])  # 'a' < 'b'
+
+        dt = DT(queryset, '/', query_config={'order[0][column]': '1', 'order[0][dir]': 'desc'})
+        dt.populate_records()
+        self.assertEqual(list(dt._records[:1]), [obj1])  # 'c' > 'b'
+        self.assertEqual(list(dt._records), [obj1, obj2])
+
+    def test_related_lookups_avoid_per_row_queries(self):
+        for i in range(3):
+            related = models.RelatedModel.objects.create(name="related %d" % (i,))
+            obj = models.ExampleModel.objects.create(name="test name %d" % (i,), related=related)
+            obj.relateds.add(models.RelatedM2MModel.objects.create(name="m2m %d" % (i,)))
+        queryset = models.ExampleModel.objects.all()
+
+        class DT(Datatable):
+            related = columns.TextColumn("Related", sources=['related__name'])
+            compound = columns.CompoundColumn("Compound", sources=[
+                columns.TextColumn(source='relateds__name'),
+            ], processor='get_compound_data')
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'related', 'compound']
+
+            def get_compound_data(self, obj, **kwargs):
+                return ", ".join(related.name for related in obj.relateds.all())
+
+        dt = DT(queryset, '/')
+        dt.configure()
+        self.assertEqual(dt.select_related, ['related'])
+        self.assertEqual(dt.prefetch_related, ['relateds'])
+        with self.assertNumQueries(4):  # two counts, the page, the prefetch
+            records = dt.get_records()
+        self.assertEqual([(r['1'], r['2']) for r in records],
+                         [("related %d" % (i,), "m2m %d" % (i,)) for i in range(3)])
+
+        class DT(DT):
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'related', 'compound']
+                optimize_related = False
+
+        dt = DT(queryset, '/')
+        with self.assertNumQueries(3 + 3 * 2):
+            dt.get_records()
+
+    def test_narrow_fields(self):
+        related = models.RelatedModel.objects.create(name="related")
+        models.ExampleModel.objects.create(name="test name", related=related)
+        queryset = models.ExampleModel.objects.all()
+
+        class DT(Datatable):
+            related = columns.TextColumn("Related", sources=['related__name'])
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'related']
+                narrow_fields = True
+                extra_fields = ['value']
+
+        dt = DT(queryset, '/', query_config={'order[0][column]': '0', 'order[0][dir]': 'asc'})
+        dt.configure()
+        self.assertEqual(dt.only_fields, ['id', 'name', 'related', 'related__name', 'value'])
+        with self.assertNumQueries(3):
+            records = dt.get_records()
+        self.assertEqual((records[0]['0'], records[0]['1']), ("test name", "related"))
+        # Deferred fields aren't loaded into the instance (get_deferred_fields() needs Django 1.8)
+        loaded = dt._records[0].__dict__
+        self.assertNotIn('date_created', loaded)
+        self.assertTrue(all(name in loaded for name in ['id', 'name', 'related_id', 'value']))
+
     def test_get_object_pk(self):
         obj1 = models.ExampleModel.objects.create(name="test name 1")
         queryset = models.ExampleModel.objects.all()
@@ -430,6 +672,34 @@ class DatatableTests(DatatableViewTestCase):
         self.assertIn('2', data)
         self.assertIn(data['2'], 'second')
 
+    def test_get_record_data_compiles_row_renderer_once(self):
+        class CustomColumn(columns.Column):
+            def get_processor_kwargs(self, **extra_kwargs):
+                kwargs = super(CustomColumn, self).get_processor_kwargs(**extra_kwargs)
+                kwargs['custom'] = True
+                return kwargs
+
+        class DT(Datatable):
+            custom = CustomColumn("Custom", sources=['name'], processor='get_custom')
+
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'custom']
+
+            def get_custom(self, obj, **kwargs):
+                self.seen_kwargs = kwargs
+                return kwargs['default_value'].upper()
+
+        obj1 = models.ExampleModel.objects.create(name="test name 1")
+        obj2 = models.ExampleModel.objects.create(name="test name 2")
+        dt = DT(models.ExampleModel.objects.all(), '/')
+        renderer = dt.get_row_renderer()
+        self.assertEqual(dt.get_record_data(obj1)['1'], 'TEST NAME 1')
+        self.assertEqual(dt.get_record_data(obj2)['1'], 'TEST NAME 2')
+        self.assertIs(dt.get_row_renderer(), renderer)
+        self.assertEqual(dt.seen_kwargs['custom'], True)
+        self.assertEqual(dt.seen_kwargs['field_name'], 'custom')
+
     def test_get_processor_method(self):
         class Dummy(object):
             def fake_callback(self):
@@ -556,6 +826,102 @@ class DatatableTests(DatatableViewTestCase):
         self.assertEqual(isgenerator(dt.__iter__()), True)
         self.assertEqual(list(dt), [dt.columns['name'], dt.columns['fake1'], dt.columns['fake2']])
 
+    def test_search_plan_is_cached_per_class(self):
+        obj1 = models.ExampleModel.objects.create(name="test name 1")
+        obj2 = models.ExampleModel.objects.create(name="other")
+        queryset = models.ExampleModel.objects.all()
+
+        class DT(Datatable):
+            mixed = columns.CompoundColumn("Mixed", sources=['pk', 'name'])
+
+            class Meta:
+                model = models.ExampleModel
+                columns = ['mixed']
+
+        dt = DT(queryset, '/', query_config={'search[value]': 'test'})
+        dt.populate_records()
+        # Each compound source uses its own handler's lookup types
+        self.assertEqual(list(dt._records), [obj1])
+        column = dt.columns['mixed']
+        planned_column, plan = DT._search_plans[(models.ExampleModel, 'mixed',
+                                                 column.get_search_plan_key())]
+        self.assertIs(planned_column, column)
+        self.assertEqual([lookup[0] for lookup in plan[1][3]], ['icontains', 'in'])
+
+        # Later instances reuse the plan, bound to their own copy of the column
+        dt = DT(queryset, '/', query_config={'search[value]': 'other'})
+        dt.configure()
+        rebound_plan = dt.get_search_plan('mixed', dt.columns['mixed'])
+        self.assertEqual(len(DT._search_plans), 1)
+        self.assertEqual([source[0] for source in rebound_plan], [source[0] for source in plan])
+        self.assertEqual(list(dt.search(queryset)), [obj2])
+
+    def test_search_plan_follows_per_instance_columns(self):
+        obj1 = models.ExampleModel.objects.create(name="test name 1", value=False)
+        obj2 = models.ExampleModel.objects.create(name="other", value=True)
+        queryset = models.ExampleModel.objects.all()
+
+        class DT(Datatable):
+            value = columns.BooleanColumn("Value", sources=['value'])
+
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'value']
+
+            def __init__(self, *args, **kwargs):
+                sources = kwargs.pop('name_sources', None)
+                label = kwargs.pop('value_label', None)
+                super(DT, self).__init__(*args, **kwargs)
+                if sources:
+                    self.columns['name'] = columns.IntegerColumn("Name", sources=sources)
+                if label:
+                    self.columns['value'].label = label
+
+        dt = DT(queryset, '/', query_config={'search[value]': 'test'})
+        dt.configure()
+        self.assertEqual(list(dt.search(queryset)), [obj1])
+
+        # A column reconfigured for one instance gets its own plan
+        dt = DT(queryset, '/', query_config={'search[value]': str(obj2.pk)}, name_sources=['pk'])
+        dt.configure()
+        self.assertEqual(list(dt.search(queryset)), [obj2])
+        self.assertEqual(len(DT._search_plans), 3)
+
+        # Methods in a shared plan read the searching instance's column
+        dt = DT(queryset, '/', query_config={'search[value]': 'enabled'}, value_label="Enabled")
+        dt.configure()
+        self.assertEqual(list(dt.search(queryset)), [obj2])
+
+    def test_search_skips_columns_that_cannot_accept_term(self):
+        obj1 = models.ExampleModel.objects.create(name="test name 1")
+        queryset = models.ExampleModel.objects.all()
+        terms = []
+
+        class RecordingColumn(columns.IntegerColumn):
+            term_kinds = ('integer',)
+
+            def prep_search_value(self, term, lookup_type):
+                terms.append(term)
+                return super(RecordingColumn, self).prep_search_value(term, lookup_type)
+
+        class DT(Datatable):
+            number = RecordingColumn("Number", sources=['pk'])
+
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'number']
+
+        dt = DT(queryset, '/', query_config={'search[value]': 'test %d' % obj1.pk})
+        dt.populate_records()
+        self.assertEqual(list(dt._records), [obj1])
+        self.assertEqual(set(terms), {'%d' % obj1.pk})
+
+        # Overriding prep_search_value without declaring term_kinds accepts every term
+        class AnyTermColumn(columns.IntegerColumn):
+            def prep_search_value(self, term, lookup_type):
+                return None
+        self.assertIs(AnyTermColumn.term_kinds, None)
+
     def test_search_term_basic(self):
         obj1 = models.ExampleModel.objects.create(name="test name 1")
         obj2 = models.ExampleModel.objects.create(name="test name 2")
@@ -694,6 +1060,154 @@ class DatatableTests(DatatableViewTestCase):
         self.assertEquals(list(dt._records), [])
 
 
+    def test_search_union_strategy(self):
+        r1 = models.RelatedModel.objects.create(name="test related 1 one")
+        r2 = models.RelatedModel.objects.create(name="test related 2 two")
+        m2m = models.RelatedM2MModel.objects.create(name="joined two")
+        obj1 = models.ExampleModel.objects.create(name="test name 1", related=r1)
+        obj2 = models.ExampleModel.objects.create(name="test name 2", related=r2)
+        obj1.relateds.add(m2m)
+
+        queryset = models.ExampleModel.objects.order_by('pk')
+
+        class DT(Datatable):
+            related = columns.TextColumn("Related", ['related__name'])
+            relateds = columns.TextColumn("Relateds", ['relateds__name'])
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'related', 'relateds']
+                search_strategy = 'union'
+
+        for term, expected in [('test', [obj1, obj2]), ('test 2', [obj2]), ('two', [obj1, obj2]),
+                               ('one two', [obj1]), ('test three', [])]:
+            dt = DT(queryset, '/', query_config={'search[value]': term})
+            dt.configure()
+            searched = dt.search(queryset)
+            if hasattr(queryset, 'union'):  # Otherwise ORed pk subqueries, before Django 1.11
+                self.assertIn('UNION', str(searched.query))
+            self.assertEqual(list(searched), expected)
+
+        # Conditions on the same table are kept in one plain OR
+        dt = DT(queryset, '/', query_config={'search[value]': 'test'})
+        dt.configure()
+        q = dt.get_union_search_query(queryset, [Q(name='a'), Q(pk=0) | Q(name='b')])
+        self.assertEqual(list(queryset.filter(q)), [])
+        self.assertNotIn('pk__in', str(q))
+
+
+    def test_search_plural_sources_use_subquery(self):
+        m2m1 = models.RelatedM2MModel.objects.create(name="joined one")
+        m2m2 = models.RelatedM2MModel.objects.create(name="joined two")
+        obj1 = models.ExampleModel.objects.create(name="test name 1")
+        obj2 = models.ExampleModel.objects.create(name="test name 2")
+        obj1.relateds.add(m2m1, m2m2)
+
+        queryset = models.ExampleModel.objects.all()
+
+        class DT(Datatable):
+            relateds = columns.TextColumn("Relateds", ['relateds__name'])
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'relateds']
+
+        # Both related rows match, but obj1 is only found once
+        dt = DT(queryset, '/', query_config={'search[value]': 'joined'})
+        dt.populate_records()
+        self.assertEqual(list(dt._records), [obj1])
+        self.assertEqual(dt.unpaged_record_count, 1)
+        self.assertNotIn('JOIN', str(dt._records.query).split(' WHERE ')[0])
+
+        # Terms may be satisfied by different related rows
+        dt = DT(queryset, '/', query_config={'search[value]': 'one two'})
+        dt.populate_records()
+        self.assertEqual(list(dt._records), [obj1])
+
+        dt = DT(queryset, '/', query_config={'search[value]': 'test'})
+        dt.populate_records()
+        self.assertEqual(list(dt._records), [obj1, obj2])
+        self.assertEqual(dt.unpaged_record_count, 2)
+
+
+    @skipIf(django.VERSION < (1, 8), "Query expressions require Django 1.8")
+    def test_expression_column(self):
+        r1 = models.RelatedModel.objects.create(name="zeta")
+        r2 = models.RelatedModel.objects.create(name="alpha")
+        obj1 = models.ExampleModel.objects.create(name="first", related=r1)
+        obj2 = models.ExampleModel.objects.create(name="second", related=r2)
+
+        class DT(Datatable):
+            label = columns.ExpressionColumn("Label", expression=Concat(
+                'related__name', Value(': '), 'name', output_field=CharField()))
+            double = columns.ExpressionColumn("Double", expression=F('pk') * 2, alias='double')
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'label', 'double']
+
+        for datatable_class in (DT, type('ValuesDT', (ValuesDatatable, DT), {})):
+            queryset = models.ExampleModel.objects.all()
+            dt = datatable_class(queryset, '/', query_config={
+                'order[0][column]': '1',
+                'order[0][dir]': 'asc',
+            })
+            dt.configure()
+            self.assertEqual(dt.get_ordering_splits(), (['label'], []))
+            dt.populate_records()
+            records = list(dt.get_records())
+            self.assertEqual([r['1'] for r in records], ["alpha: second", "zeta: first"])
+            self.assertEqual([r['2'] for r in records], [str(obj2.pk * 2), str(obj1.pk * 2)])
+
+            dt = datatable_class(queryset, '/', query_config={'search[value]': 'ta: fir'})
+            dt.populate_records()
+            self.assertEqual([r['pk'] for r in dt.get_records()], [obj1.pk])
+
+            dt = datatable_class(queryset, '/', query_config={'search[value]': str(obj2.pk * 2)})
+            dt.populate_records()
+            self.assertIn(obj2.pk, [r['pk'] for r in dt.get_records()])
+
+
+    @skipIf(django.VERSION < (1, 8), "Query expressions require Django 1.8")
+    def test_aggregate_columns(self):
+        m2m1 = models.RelatedM2MModel.objects.create(name="a")
+        m2m2 = models.RelatedM2MModel.objects.create(name="b")
+        obj1 = models.ExampleModel.objects.create(name="first")
+        obj2 = models.ExampleModel.objects.create(name="second")
+        obj3 = models.ExampleModel.objects.create(name="third")
+        obj1.relateds.add(m2m1)
+        obj2.relateds.add(m2m1, m2m2)
+        models.ReverseRelatedModel.objects.create(name="r", example=obj3)
+
+        class DT(Datatable):
+            n_relateds = columns.CountColumn("Relateds", source='relateds')
+            last_related = columns.MaxColumn("Last related", source='relateds__name')
+            n_reverse = columns.AggregateColumn("Reverse", source='reverserelatedmodel',
+                                                aggregate=Count)
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'n_relateds', 'last_related', 'n_reverse']
+                ordering = ['-n_relateds', 'name']
+
+        with self.assertRaises(ValueError):
+            columns.CountColumn("Missing source")
+
+        queryset = models.ExampleModel.objects.all()
+        dt = DT(queryset, '/')
+        dt.populate_records()
+        if columns.Subquery is not None:  # Otherwise annotated directly, before Django 1.11
+            self.assertNotIn('GROUP BY', str(dt._records.query).split(' FROM ')[-1])
+        with self.assertNumQueries(1):
+            records = list(dt.get_records())
+        self.assertEqual([(r['0'], r['1'], r['2'], r['3']) for r in records], [
+            ("second", "2", "b", "0"),
+            ("first", "1", "a", "0"),
+            ("third", "0", "", "1"),
+        ])
+        self.assertEqual(dt.unpaged_record_count, 3)
+
+        dt = DT(queryset, '/', query_config={'columns[1][search][value]': '2'})
+        dt.populate_records()
+        self.assertEqual(list(dt._records), [obj2])
+
+
 class ValuesDatatableTests(DatatableViewTestCase):
     def test_get_object_pk(self):
         obj1 = models.ExampleModel.objects.create(name="test name 1")
@@ -701,3 +1215,178 @@ class ValuesDatatableTests(DatatableViewTestCase):
         dt = ValuesDatatable(queryset, '/')
         obj_data = queryset.values('pk')[0]
         self.assertEqual(dt.get_object_pk(obj_data), obj1.pk)
+
+    def test_sort_by_plural_source(self):
+        m2m_a = models.RelatedM2MModel.objects.create(name="a")
+        m2m_b = models.RelatedM2MModel.objects.create(name="b")
+        m2m_c = models.RelatedM2MModel.objects.create(name="c")
+        obj1 = models.ExampleModel.objects.create(name="first")
+        obj1.relateds.add(m2m_b, m2m_c)
+        obj2 = models.ExampleModel.objects.create(name="second")
+        obj2.relateds.add(m2m_a, m2m_c)
+
+        class DT(ValuesDatatable):
+            related = columns.TextColumn("Related", sources=['relateds__name'])
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'related']
+
+        queryset = models.ExampleModel.objects.all()
+        dt = DT(queryset, '/', query_config={'order[0][column]': '1', 'order[0][dir]': 'asc'})
+        dt.populate_records()
+        self.assertEqual([r['pk'] for r in dt.get_records()], [obj2.pk, obj1.pk])
+
+
+class KeysetPaginationTests(DatatableViewTestCase):
+    def setUp(self):
+        self.objects = [models.ExampleModel.objects.create(name=name) for name in "cbeda"]
+
+    def get_datatable(self, **query_config):
+        class DT(Datatable):
+            fake = columns.TextColumn("Fake", sources=['get_absolute_url'])
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'fake', 'date_created']
+                page_length = 2
+                pagination = 'keyset'
+
+        query_config.setdefault('order[0][column]', '0')
+        query_config.setdefault('order[0][dir]', 'desc')
+        dt = DT(models.ExampleModel.objects.all(), '/', query_config=query_config)
+        dt.populate_records()
+        return dt
+
+    def test_keyset_ordering_appends_pk(self):
+        dt = self.get_datatable()
+        self.assertEqual(dt.get_keyset_ordering(), ['-name', 'pk'])
+
+    def test_keyset_ordering_falls_back_for_virtual_columns(self):
+        dt = self.get_datatable(**{'order[0][column]': '1'})
+        self.assertEqual(dt.get_keyset_ordering(), None)
+
+    def test_cursor_seeks_to_next_page(self):
+        dt = self.get_datatable()
+        self.assertEqual([r['0'] for r in dt.get_records()], ['e', 'd'])
+        self.assertIsNotNone(dt.next_cursor)
+
+        dt = self.get_datatable(displayStart='2', cursor=dt.next_cursor)
+        page = dt._get_current_page()
+        self.assertNotIn('OFFSET', str(page.query))
+        self.assertEqual([r['0'] for r in dt.get_records()], ['c', 'b'])
+
+        dt = self.get_datatable(displayStart='4', cursor=dt.next_cursor)
+        self.assertEqual([r['0'] for r in dt.get_records()], ['a'])
+        self.assertIsNone(dt.next_cursor)
+
+    def test_cursor_ignored_for_other_offsets(self):
+        dt = self.get_datatable()
+        dt.get_records()
+        dt = self.get_datatable(displayStart='4', cursor=dt.next_cursor)
+        self.assertIn('OFFSET', str(dt._get_current_page().query))
+        self.assertEqual([r['0'] for r in dt.get_records()], ['a'])
+
+        dt = self.get_datatable(displayStart='2', cursor='garbage')
+        self.assertIsNone(dt.config['cursor'])
+        self.assertEqual([r['0'] for r in dt.get_records()], ['c', 'b'])
+
+    def test_cursor_with_invalid_values_is_ignored(self):
+        import json, base64
+        for values in (["n1", "abc"], ["n1", None], [{"a": 1}, 1], [["n1"], 1]):
+            cursor = json.dumps([2, ['-name', 'pk'], values]).encode('utf-8')
+            dt = self.get_datatable(displayStart='2', cursor=base64.urlsafe_b64encode(cursor).decode('ascii'))
+            self.assertIsNone(dt.config['cursor'])
+            self.assertEqual([r['0'] for r in dt.get_records()], ['c', 'b'])
+
+        cursor = json.dumps([2, ['-name', 'pk'], ["d", str(self.objects[3].pk)]]).encode('utf-8')
+        dt = self.get_datatable(displayStart='2', cursor=base64.urlsafe_b64encode(cursor).decode('ascii'))
+        self.assertEqual(dt.config['cursor']['values'], ["d", self.objects[3].pk])
+        self.assertEqual([r['0'] for r in dt.get_records()], ['c', 'b'])
+
+    def test_cursor_keeps_microseconds(self):
+        from datetime import timedelta
+        created = self.objects[0].date_created.replace(microsecond=0)
+        for i, obj in enumerate(self.objects):
+            models.ExampleModel.objects.filter(pk=obj.pk).update(
+                date_created=created + timedelta(microseconds=i))
+
+        names = []
+        cursor = None
+        for start in (0, 2, 4):
+            dt = self.get_datatable(displayStart=str(start), cursor=cursor or '',
+                                    **{'order[0][column]': '2', 'order[0][dir]': 'asc'})
+            names.extend(r['0'] for r in dt.get_records())
+            cursor = dt.next_cursor
+        self.assertEqual(names, list("cbeda"))
+
+
+class ConcurrentQueriesTests(DatatableViewTestCase):
+    """
+    The default test database is held in memory inside of a transaction, which worker threads
+    can't see, so these tests use a file-backed database of their own.
+    """
+
+    alias = 'datatableview_concurrent'
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connections.databases[self.alias] = dict(connections.databases['default'],
+                                                 NAME=self.path, TEST={'NAME': self.path})
+        call_command('migrate', database=self.alias, run_syncdb=True, interactive=False,
+                     skip_checks=True, verbosity=0)
+        for i in range(5):
+            models.ExampleModel.objects.using(self.alias).create(name="test name %d" % (i,))
+
+    def tearDown(self):
+        connections[self.alias].close()
+        del connections[self.alias]
+        del connections.databases[self.alias]
+        os.remove(self.path)
+
+    def test_counts_run_on_worker_threads(self):
+        calls = []
+
+        class RecordingCount(counts.ExactCount):
+            def count_queryset(self, queryset):
+                calls.append((threading.current_thread(), connections[queryset.db]))
+                return super(RecordingCount, self).count_queryset(queryset)
+
+        class DT(Datatable):
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name']
+                page_length = 2
+                count_strategy = RecordingCount()
+                concurrent_queries = True
+
+        queryset = models.ExampleModel.objects.using(self.alias).all()
+        dt = DT(queryset, '/', query_config={'search[value]': 'name'})
+        dt.populate_records()
+        self.assertEqual(dt.unpaged_record_count, 5)
+        self.assertEqual(dt.total_initial_record_count, 5)
+        self.assertEqual(len(calls), 2)
+        for thread, connection in calls:
+            self.assertIsNot(thread, threading.current_thread())
+            self.assertIsNone(connection.connection)
+
+        # The page was fetched alongside the counts
+        with self.assertNumQueries(0, using=self.alias):
+            self.assertEqual([r['0'] for r in dt.get_records()], ["test name 0", "test name 1"])
+
+        # Unpaged results are left for the response to read or stream
+        dt = DT(queryset, '/', query_config={'pageLength': '-1'})
+        with self.assertNumQueries(0, using=self.alias):
+            dt.populate_records()
+        self.assertEqual(dt.unpaged_record_count, 5)
+        with self.assertNumQueries(1, using=self.alias):
+            self.assertEqual(len(list(dt.iter_records())), 5)
+
+        # Worker connections couldn't see the changes of an open transaction
+        del calls[:]
+        with transaction.atomic(using=self.alias):
+            models.ExampleModel.objects.using(self.alias).create(name="uncommitted")
+            dt = DT(queryset, '/')
+            dt.populate_records()
+            self.assertEqual(dt.unpaged_record_count, 6)
+        self.assertEqual([thread for thread, _ in calls], [threading.current_thread()] * 2)
+
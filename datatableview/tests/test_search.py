@@ -0,0 +1,182 @@
+# -*- encoding: utf-8 -*-
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+import six
+
+from .testcase import DatatableViewTestCase
+from .test_app import models
+from ..datatables import Datatable
+from .. import columns
+from .. import search
+
+
+class SearchDatatable(Datatable):
+    related = columns.TextColumn("Related", ['related__name'])
+    relateds = columns.TextColumn("Relateds", ['relateds__name'])
+
+    class Meta:
+        model = models.ExampleModel
+        columns = ['name', 'related', 'relateds']
+        search_backend = 'fts5'
+
+
+class DocumentDatatable(Datatable):
+    related = columns.TextColumn("Related", ['related__name'])
+    relateds = columns.TextColumn("Relateds", ['relateds__name'])
+
+    class Meta:
+        model = models.SearchDocumentModel
+        columns = ['name', 'related', 'relateds', 'search_document']
+        search_backend = 'document'
+
+
+class SearchBackendTests(DatatableViewTestCase):
+    def setUp(self):
+        related = models.RelatedModel.objects.create(name="Related Django")
+        self.obj1 = models.ExampleModel.objects.create(name="first example", related=related)
+        self.obj2 = models.ExampleModel.objects.create(name="second example")
+        self.obj2.relateds.add(models.RelatedM2MModel.objects.create(name="joined one"),
+                               models.RelatedM2MModel.objects.create(name="joined two"))
+
+    def get_records(self, term, datatable_class=SearchDatatable):
+        queryset = models.ExampleModel.objects.all()
+        dt = datatable_class(queryset, '/', query_config={'search[value]': term})
+        dt.configure()
+        return list(dt.search(queryset))
+
+    def test_get_search_backend(self):
+        self.assertIsInstance(search.get_search_backend('orm'), search.ORMSearchBackend)
+        self.assertIsInstance(search.get_search_backend(search.FTS5SearchBackend),
+                              search.FTS5SearchBackend)
+        backend = search.TSVectorSearchBackend(config='english')
+        self.assertIs(search.get_search_backend(backend), backend)
+        with self.assertRaises(ValueError):
+            search.get_search_backend('fake')
+
+    def test_iter_documents(self):
+        dt = SearchDatatable(models.ExampleModel.objects.all(), '/')
+        self.assertEqual(dict(search.iter_documents(dt)), {
+            self.obj1.pk: "first example Related Django",
+            self.obj2.pk: "second example joined one joined two",
+        })
+
+    def test_fts5_search(self):
+        dt = SearchDatatable(models.ExampleModel.objects.none(), '/')
+        search.FTS5SearchBackend().build(dt)
+
+        self.assertEqual(self.get_records('example'), [self.obj1, self.obj2])
+        self.assertEqual(self.get_records('dja'), [self.obj1])
+        self.assertEqual(self.get_records('join two'), [self.obj2])
+        self.assertEqual(self.get_records('"odd" "term'), [])
+
+        # Records are found by their indexed document until the index is updated
+        self.obj1.name = "renamed"
+        self.obj1.save()
+        self.assertEqual(self.get_records('first'), [self.obj1])
+        search.FTS5SearchBackend().update(dt, [self.obj1.pk])
+        self.assertEqual(self.get_records('first'), [])
+        self.assertEqual(self.get_records('renamed'), [self.obj1])
+
+    def test_unsupported_database_uses_columns(self):
+        class DT(SearchDatatable):
+            class Meta:
+                model = models.ExampleModel
+                columns = ['name', 'related', 'relateds']
+                search_backend = search.TSVectorSearchBackend
+
+        dt = DT(models.ExampleModel.objects.none(), '/')
+        with self.assertRaises(ValueError):
+            search.TSVectorSearchBackend().build(dt)
+        self.assertEqual(self.get_records('ngo', DT), [self.obj1])
+
+    def test_command(self):
+        out = six.StringIO()
+        call_command('datatable_search_index', 'datatableview.tests.test_search.SearchDatatable',
+                     backend='fulltext', skip_checks=True, stdout=out)
+        self.assertIn("Built the 'fulltext' search index", out.getvalue())
+        self.assertIn("from 2 records", out.getvalue())
+        self.assertEqual(self.get_records('second'), [self.obj2])
+
+        out = six.StringIO()
+        call_command('datatable_search_index', 'datatableview.tests.test_search.SearchDatatable',
+                     backend='orm', skip_checks=True, stdout=out)
+        self.assertIn("no search index", out.getvalue())
+
+        backend = search.FullTextSearchBackend(backends=[search.TSVectorSearchBackend])
+        with self.assertRaises(ValueError):
+            backend.build(SearchDatatable(models.ExampleModel.objects.none(), '/'))
+
+
+class DocumentSearchBackendTests(DatatableViewTestCase):
+    def setUp(self):
+        self.receiver = search.DocumentSearchBackend().connect(DocumentDatatable)
+
+    def tearDown(self):
+        self.receiver.disconnect()
+
+    def get_records(self, term):
+        queryset = models.SearchDocumentModel.objects.all()
+        dt = DocumentDatatable(queryset, '/', query_config={'search[value]': term})
+        dt.configure()
+        return list(dt.search(queryset))
+
+    def get_document(self, obj):
+        return models.SearchDocumentModel.objects.get(pk=obj.pk).search_document
+
+    def test_signals_maintain_document(self):
+        related = models.RelatedModel.objects.create(name="Related")
+        m2m = models.RelatedM2MModel.objects.create(name="Joined")
+        obj = models.SearchDocumentModel.objects.create(name="Example", related=related)
+        self.assertEqual(self.get_document(obj), "example related")
+
+        obj.relateds.add(m2m)
+        self.assertEqual(self.get_document(obj), "example related joined")
+
+        related.name = "Renamed"
+        related.save()
+        m2m.name = "Rejoined"
+        m2m.save()
+        self.assertEqual(self.get_document(obj), "example renamed rejoined")
+
+        m2m.searchdocumentmodel_set.clear()
+        self.assertEqual(self.get_document(obj), "example renamed")
+
+        obj.relateds.add(m2m)
+        m2m.delete()
+        self.assertEqual(self.get_document(obj), "example renamed")
+
+        self.assertEqual(self.get_records('ExAm Renamed'), [obj])
+        self.assertEqual(self.get_records('rejoined'), [])
+
+    def test_backfill_command(self):
+        self.receiver.disconnect()
+        related = models.RelatedModel.objects.create(name="Related")
+        obj = models.SearchDocumentModel.objects.create(name="Example", related=related)
+        self.assertEqual(self.get_records('related'), [])
+
+        call_command('datatable_search_index', 'datatableview.tests.test_search.DocumentDatatable',
+                     skip_checks=True, stdout=six.StringIO())
+        self.assertEqual(self.get_document(obj), "example related")
+        self.assertEqual(self.get_records('related'), [obj])
+
+    def test_build_batches_updates(self):
+        self.receiver.disconnect()
+        objs = [models.SearchDocumentModel.objects.create(name="Example %d" % (i,))
+                for i in range(3)]
+        backend = search.DocumentSearchBackend()
+        backend.chunk_size = 2
+        dt = DocumentDatatable(models.SearchDocumentModel.objects.none(), '/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(backend.build(dt), 3)
+        self.assertEqual([self.get_document(obj) for obj in objs],
+                         ["example 0", "example 1", "example 2"])
+        updates = [query for query in queries.captured_queries if 'UPDATE' in query['sql']]
+        self.assertEqual(len(updates), 3 if search.Case is None else 2)
+
+        models.SearchDocumentModel.objects.update(name="Renamed")
+        backend.update(dt, [objs[1].pk])
+        self.assertEqual([self.get_document(obj) for obj in objs],
+                         ["example 0", "renamed", "example 2"])
@@ -1,5 +1,7 @@
 # -*- encoding: utf-8 -*-
 
+from django.db.models.fields import FieldDoesNotExist
+
 from .testcase import DatatableViewTestCase
 from .test_app import models
 from ..columns import Column
@@ -33,3 +35,62 @@ class UtilsTests(DatatableViewTestCase):
         """ Verify that ExampleModel->>>RelatedM2MModel.name == RelatedM2MModel.name """
         remote_field = utils.resolve_orm_path(models.ExampleModel, 'relateds__name')
         self.assertEqual(remote_field, get_field(models.RelatedM2MModel._meta, 'name')[0])
+
+    def test_resolve_orm_path_is_memoized(self):
+        """ Verify that lookups, including failed ones, are cached until the cache is cleared. """
+        utils.clear_orm_path_cache()
+        field = utils.resolve_orm_path(models.ExampleModel, 'related__name')
+        self.assertIs(utils.resolve_orm_path(models.ExampleModel(), 'related__name'), field)
+        self.assertIn(('resolve_orm_path', models.ExampleModel, 'related__name'),
+                      utils._orm_path_cache)
+        for i in range(2):
+            with self.assertRaises(FieldDoesNotExist):
+                utils.resolve_orm_path(models.ExampleModel, 'related__fake')
+
+        self.assertTrue(utils.contains_plural_field(models.ExampleModel, ['-relateds__name']))
+        self.assertFalse(utils.contains_plural_field(models.ExampleModel, ['related__name']))
+
+        utils.clear_orm_path_cache()
+        self.assertEqual(utils._orm_path_cache, {})
+
+    def test_classify_term(self):
+        self.assertEqual(utils.classify_term('foo'), {'text'})
+        self.assertEqual(utils.classify_term('True'), {'text', 'boolean'})
+        self.assertEqual(utils.classify_term('-12'), {'text', 'date', 'integer', 'decimal'})
+        self.assertEqual(utils.classify_term('1, 2'), {'text', 'date', 'integer', 'decimal'})
+        self.assertEqual(utils.classify_term('1.5-3'), {'text', 'date', 'decimal'})
+        self.assertEqual(utils.classify_term('2017/01/05'), {'text', 'date'})
+        self.assertEqual(utils.classify_term('Feb'), {'text', 'date'})
+
+    def test_composite_sort_key(self):
+        """ Verify that each value in the key is compared in its own direction. """
+        keys = [
+            utils.CompositeSortKey((1, 'b'), (False, True)),
+            utils.CompositeSortKey((0, 'a'), (False, True)),
+            utils.CompositeSortKey((1, 'c'), (False, True)),
+        ]
+        self.assertEqual([k.values for k in sorted(keys)], [(0, 'a'), (1, 'c'), (1, 'b')])
+
+    def test_offset_list(self):
+        """ Verify that slices and indexes are given in the larger sequence's positions. """
+        items = utils.OffsetList(['c', 'd'], offset=2)
+        self.assertEqual(items[2:4], ['c', 'd'])
+        self.assertEqual(items[3:], ['d'])
+        self.assertEqual(items[:3], ['c'])
+        self.assertEqual(items[2], 'c')
+
+    def test_get_related_lookups(self):
+        """ Verify that forward paths are joined and plural paths are prefetched. """
+        select_related, prefetch_related = utils.get_related_lookups(models.ExampleModel, [
+            'name', 'related__name', 'related__get_absolute_url', 'relateds__name',
+            'reverserelatedmodel__example__related', 'get_absolute_url',
+        ])
+        self.assertEqual(select_related, ['related'])
+        self.assertEqual(prefetch_related, ['relateds', 'reverserelatedmodel__example__related'])
+
+    def test_get_only_fields(self):
+        """ Verify that relationship fields are kept on the way to related values. """
+        only = utils.get_only_fields(models.ExampleModel, [
+            'pk', 'name', '-name', 'related__name', 'relateds__name', 'get_absolute_url',
+        ])
+        self.assertEqual(only, ['id', 'name', 'related', 'related__name'])
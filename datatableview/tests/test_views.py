@@ -4,9 +4,13 @@ import json
 
 import django
 from django.core.urlresolvers import reverse
+from django.test import RequestFactory
 
 import six
 
+from datatableview import Datatable
+from datatableview.views.base import get_datatable_subclass, _datatable_class_cache
+
 from .testcase import DatatableViewTestCase
 from .example_project.example_project.example_app import views
 from .example_project.example_project.example_app import models
@@ -170,3 +174,68 @@ class ViewsTests(DatatableViewTestCase):
         view.request = FakeRequest(url)
         response = self.client.get(url)
         obj = self.get_json_response(url)
+
+    def test_unpaged_response_streams(self):
+        blog = models.Blog.objects.create(name="Blog", tagline="")
+        for i in range(3):
+            models.Entry.objects.create(blog=blog, headline="Entry %d" % i, body_text="",
+                                        pub_date='2017-01-01', mod_date='2017-01-01',
+                                        n_comments=0, n_pingbacks=0, rating=0, status=0)
+
+        def get_content(response):
+            if response.streaming:
+                content = b''.join(response.streaming_content)
+            else:
+                content = response.content
+            if six.PY3:
+                content = content.decode()
+            return json.loads(content)
+
+        url = reverse('zero-configuration')
+        request = RequestFactory().get(url, {'pageLength': '-1', 'ajax': 'true'})
+        view = views.ZeroConfigurationDatatableView
+        response = view.as_view(stream_unpaged=True, stream_chunk_size=2)(request)
+        self.assertTrue(response.streaming)
+        streamed = get_content(response)
+
+        response = view.as_view()(request)
+        self.assertFalse(response.streaming)
+        self.assertEqual(streamed, get_content(response))
+        self.assertEqual(len(streamed['data']), models.Entry.objects.count())
+
+    def test_synthesized_datatable_classes_are_cached(self):
+        url = reverse('zero-configuration')
+        request = RequestFactory().get(url, {'pageLength': '-1', 'ajax': 'true'})
+        view = views.ZeroConfigurationDatatableView(request=request, args=(), kwargs={})
+        datatable = view.get_datatable()
+        datatable.configure()
+        self.assertEqual(datatable.config['page_length'], -1)
+
+        other = views.ZeroConfigurationDatatableView(request=RequestFactory().get(url), args=(),
+                                                     kwargs={}).get_datatable()
+        self.assertIs(type(other), type(datatable))
+        other.configure()
+        self.assertEqual(other.config['page_length'], 25)
+
+        view.datatable_class = Datatable
+        datatable_class = type(view.get_datatable())
+        self.assertIs(type(view.get_datatable()), datatable_class)
+        view.page_length = 50
+        datatable = view.get_datatable()
+        self.assertIsNot(type(datatable), datatable_class)
+        self.assertEqual(datatable._meta.page_length, 50)
+
+        class BlogView(views.ZeroConfigurationDatatableView):
+            model = models.Blog
+
+        blog = BlogView(request=request, args=(), kwargs={}).get_datatable()
+        self.assertIsNot(type(blog), type(other))
+        self.assertIs(blog._meta.model, models.Blog)
+        self.assertIs(other._meta.model, models.Entry)
+
+        class Meta:
+            labels = {'id': view.get_datatable_class}  # Bound to this view instance
+
+        first = get_datatable_subclass('BoundDatatable', Datatable, Meta)
+        self.assertIsNot(get_datatable_subclass('BoundDatatable', Datatable, Meta), first)
+        self.assertNotIn(('BoundDatatable', Datatable), [key[:2] for key in _datatable_class_cache])
@@ -1,11 +1,20 @@
 # -*- encoding: utf-8 -*-
 
+import re
+import calendar
+import threading
+from functools import wraps
 try:
     from functools import reduce
 except ImportError:
     pass
 
+try:
+    from django.core.signals import setting_changed
+except ImportError:  # Django < 1.8
+    from django.test.signals import setting_changed
 from django.db import models
+from django.db.models.signals import class_prepared
 from django.db.models.fields import FieldDoesNotExist
 from django.utils.text import smart_split
 try:
@@ -15,7 +24,7 @@ except ImportError:
     from django.db.models.fields.related import RelatedField
     USE_RELATED_OBJECT = False
 
-from .compat import get_field
+from .compat import get_field, get_field_relation
 
 MINIMUM_PAGE_LENGTH = 1
 DEFAULT_EMPTY_VALUE = ""
@@ -30,6 +39,7 @@ OPTION_NAME_MAP = {
     'search_column': 'columns[%d][search][value]',
     'sort_column': 'order[%d][column]',
     'sort_column_direction': 'order[%d][dir]',
+    'cursor': 'cursor',
 }
 
 # Mapping of Django's supported field types to their more generic type names.
@@ -60,6 +70,63 @@ XEDITABLE_FIELD_TYPES = {
     'ForeignKey': 'select',
 }
 
+# Process-wide memo of ORM path lookups, keyed by (function name, model class, path).  Failed
+# lookups are remembered too, as the exception class and args to raise again.
+_orm_path_cache = {}
+_orm_path_cache_lock = threading.Lock()
+
+
+def clear_orm_path_cache():
+    """
+    Empties the memo used by :py:func:`resolve_orm_path`, :py:func:`get_model_at_related_field` and
+    :py:func:`contains_plural_field`.  This happens automatically whenever a model class is prepared
+    or ``INSTALLED_APPS`` changes.
+    """
+    with _orm_path_cache_lock:
+        _orm_path_cache.clear()
+
+def _clear_orm_path_cache_for_model(sender, **kwargs):
+    clear_orm_path_cache()
+
+def _clear_orm_path_cache_for_setting(setting, **kwargs):
+    if setting == 'INSTALLED_APPS':
+        clear_orm_path_cache()
+
+class_prepared.connect(_clear_orm_path_cache_for_model,
+                       dispatch_uid='datatableview_clear_orm_path_cache')
+setting_changed.connect(_clear_orm_path_cache_for_setting,
+                        dispatch_uid='datatableview_clear_orm_path_cache')
+
+
+def memoize_orm_path(f):
+    """
+    Decorator for functions of ``(model, orm_path)`` whose result depends only on the model's
+    ``_meta``.  Model instances are keyed by their class.
+    """
+    @wraps(f)
+    def wrapper(model, orm_path):
+        try:
+            key = (f.__name__, model._meta.model, orm_path)
+            result = _orm_path_cache[key]
+        except TypeError:  # Unhashable path
+            return f(model, orm_path)
+        except KeyError:
+            try:
+                result = (True, f(model, orm_path))
+            except (FieldDoesNotExist, ValueError) as e:
+                result = (False, (e.__class__, e.args))
+            with _orm_path_cache_lock:
+                _orm_path_cache[key] = result
+
+        success, value = result
+        if not success:
+            exception_class, args = value
+            raise exception_class(*args)
+        return value
+    return wrapper
+
+
+@memoize_orm_path
 def resolve_orm_path(model, orm_path):
     """
     Follows the queryset-style query path of ``orm_path`` starting from ``model`` class.  If the
@@ -76,6 +143,7 @@ def resolve_orm_path(model, orm_path):
         field, _ = get_field(endpoint_model._meta, bits[-1])
     return field
 
+@memoize_orm_path
 def get_model_at_related_field(model, attr):
     """
     Looks up ``attr`` as a field of ``model`` and returns the related model class.  If ``attr`` is
@@ -114,19 +182,205 @@ def get_first_orm_bit(column):
 
 def contains_plural_field(model, fields):
     """ Returns a boolean indicating if ``fields`` contains a relationship to multiple items. """
-    source_model = model
     for orm_path in fields:
-        model = source_model
-        bits = orm_path.lstrip('+-').split('__')
-        for bit in bits[:-1]:
-            field, _ = get_field(model._meta, bit)
-            if isinstance(field, models.ManyToManyField) \
-                    or (USE_RELATED_OBJECT and isinstance(field, RelatedObject) and field.field.rel.multiple) \
-                    or (not USE_RELATED_OBJECT and isinstance(field, RelatedField) and field.one_to_many):
-                return True
-            model = get_model_at_related_field(model, bit)
+        if crosses_plural_relation(model, orm_path.lstrip('+-')):
+            return True
     return False
 
+@memoize_orm_path
+def crosses_plural_relation(model, orm_path):
+    """
+    Returns a boolean indicating if following ``orm_path`` from ``model`` traverses a relationship
+    to multiple items before reaching its final field.
+    """
+    bits = orm_path.split('__')
+    for bit in bits[:-1]:
+        field, _ = get_field(model._meta, bit)
+        if isinstance(field, models.ManyToManyField) \
+                or (USE_RELATED_OBJECT and isinstance(field, RelatedObject) and field.field.rel.multiple) \
+                or (not USE_RELATED_OBJECT and isinstance(field, RelatedField) and field.one_to_many):
+            return True
+        model = get_model_at_related_field(model, bit)
+    return False
+
+class CompositeSortKey(object):
+    """
+    Sort key combining several values that each have their own sort direction, so that a multi-key
+    ordering can be satisfied by a single comparison-based pass (``sorted()``, ``heapq``) rather
+    than one stable sort per key.  ``reverses`` is a tuple of booleans parallel to ``values``.
+    """
+
+    __slots__ = ('values', 'reverses')
+
+    def __init__(self, values, reverses):
+        self.values = values
+        self.reverses = reverses
+
+    def __getstate__(self):
+        return (self.values, self.reverses)
+
+    def __setstate__(self, state):
+        self.values, self.reverses = state
+
+    def __eq__(self, other):
+        return self.values == other.values
+
+    def __ne__(self, other):
+        return self.values != other.values
+
+    def __lt__(self, other):
+        for value, other_value, reverse in zip(self.values, other.values, self.reverses):
+            if value == other_value:
+                continue
+            if reverse:
+                return other_value < value
+            return value < other_value
+        return False
+
+    def __gt__(self, other):
+        return other < self
+
+    def __le__(self, other):
+        return not other < self
+
+    def __ge__(self, other):
+        return not self < other
+
+    __hash__ = None
+
+
+class OffsetList(list):
+    """
+    A list holding a window of items that begins at index ``offset`` of some larger sequence.
+    Slices are given in the larger sequence's indexes, so that code asking for a page of results
+    doesn't need to know that the items before ``offset`` were never loaded.
+    """
+
+    def __init__(self, items, offset=0):
+        super(OffsetList, self).__init__(items)
+        self.offset = offset
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = max((index.start or 0) - self.offset, 0)
+            stop = index.stop
+            if stop is not None:
+                stop = max(stop - self.offset, 0)
+            return list.__getitem__(self, slice(start, stop, index.step))
+        return list.__getitem__(self, index - self.offset)
+
+    def __getslice__(self, start, stop):
+        # Python 2 slices list subclasses through __getslice__ instead of __getitem__
+        return self.__getitem__(slice(start, stop))
+
+
+def get_related_lookups(model, orm_paths):
+    """
+    Plans the relationship lookups needed to read each of ``orm_paths`` from ``model`` instances.
+    Returns a 2-tuple of ``(select_related, prefetch_related)`` lists: single-valued forward paths
+    can be joined into the main query, while the first plural relationship in a path (and
+    everything after it) has to be prefetched.  Paths that stop being model fields (methods,
+    properties) are planned only up to that point.
+    """
+    select_related = []
+    prefetch_related = []
+    for orm_path in orm_paths:
+        current_model = model
+        bits = []
+        plural = False
+        for bit in orm_path.split('__'):
+            try:
+                _, related_model, field_plural, _ = get_field_relation(current_model._meta, bit)
+            except FieldDoesNotExist:
+                break
+            if related_model is None:
+                break
+            bits.append(bit)
+            plural = plural or field_plural
+            current_model = related_model
+
+        if not bits:
+            continue
+        lookups = prefetch_related if plural else select_related
+        lookup = '__'.join(bits)
+        if lookup not in lookups:
+            lookups.append(lookup)
+    return select_related, prefetch_related
+
+
+def get_only_fields(model, orm_paths):
+    """
+    Returns the list of ``queryset.only()`` paths that load just enough of ``model`` (and of the
+    single-valued relationships it joins to) to read each of ``orm_paths``.  Forward relationship
+    fields along a path are included so that the related objects can be reached.  Paths that cross
+    a plural relationship contribute only the fields leading up to it, since the related objects
+    are fetched by a separate query.
+    """
+    only = []
+    for orm_path in orm_paths:
+        current_model = model
+        bits = []
+        for bit in orm_path.lstrip('+-').split('__'):
+            if bit == 'pk':
+                bit = current_model._meta.pk.name
+            try:
+                _, related_model, plural, concrete = get_field_relation(current_model._meta, bit)
+            except FieldDoesNotExist:
+                break
+            bits.append(bit)
+            if plural:
+                break
+            if concrete:  # Reverse one-to-one fields store nothing locally
+                path = '__'.join(bits)
+                if path not in only:
+                    only.append(path)
+            if related_model is None:
+                break
+            current_model = related_model
+    return only
+
+
 def split_terms(s):
     return filter(None, map(lambda t: t.strip("'\" "), smart_split(s)))
 
+
+# Splits 'in' and 'range' style terms ("1, 2, 3" or "1-5") without breaking up negative numbers
+TERM_LIST_SEPARATOR_RE = re.compile(r'\s*,\s*|(?<=[\d.])\s*-\s*')
+
+# Month and weekday names (and abbreviations) that the date parsers understand
+DATE_WORDS = frozenset(name.lower() for name in (
+    list(calendar.month_name) + list(calendar.month_abbr) +
+    list(calendar.day_name) + list(calendar.day_abbr)
+) if name)
+
+def _is_number_list(term, number_type):
+    try:
+        for bit in TERM_LIST_SEPARATOR_RE.split(term):
+            number_type(bit)
+    except ValueError:
+        return False
+    return True
+
+def classify_term(term):
+    """
+    Returns a frozenset of the kinds of value that the search ``term`` could be coerced to, so that
+    columns can skip terms they could never match (see
+    :py:attr:`~datatableview.columns.Column.term_kinds`).  Every term is ``'text'``; it may also be
+    ``'integer'``, ``'decimal'``, ``'date'`` (it has digits, or names a month or weekday) or
+    ``'boolean'`` (``'true'`` or ``'false'``).  Comma and dash separated lists of numbers, as used
+    for ``in`` and ``range`` queries, are classified as numbers.
+    """
+    kinds = {'text'}
+    term = term.strip()
+    lowered = term.lower()
+    if lowered in ('true', 'false'):
+        kinds.add('boolean')
+    if any(c.isdigit() for c in term):
+        kinds.add('date')
+        if _is_number_list(term, int):
+            kinds.update(('integer', 'decimal'))
+        elif _is_number_list(term, float):
+            kinds.add('decimal')
+    elif any(word in DATE_WORDS for word in re.findall(r'[^\W\d_]+', lowered)):
+        kinds.add('date')
+    return frozenset(kinds)
@@ -1,11 +1,15 @@
 # -*- encoding: utf-8 -*-
 
+import functools
+import inspect
 import json
 import logging
+import threading
+from collections import OrderedDict
 
 from django.views.generic import ListView, TemplateView
 from django.views.generic.list import MultipleObjectMixin
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
 
@@ -13,8 +17,73 @@ from ..datatables import Datatable, DatatableOptions
 
 log = logging.getLogger(__name__)
 
+# Maximum number of synthesized Datatable subclasses kept by get_datatable_subclass()
+DATATABLE_CLASS_CACHE_SIZE = 256
+
+_datatable_class_cache = OrderedDict()
+_datatable_class_cache_lock = threading.Lock()
+
+
+def _freeze_option(value):
+    """
+    Returns a hashable equivalent of ``value``, raising ``TypeError`` if there isn't one.  Methods
+    bound to an instance and ``functools.partial`` objects are typically built per request and
+    hash differently every time, so they raise ``TypeError`` too rather than crowding the cache.
+    """
+    if isinstance(value, functools.partial):
+        raise TypeError("partial objects are not cached")
+    if inspect.ismethod(value):
+        owner = getattr(value, '__self__', None)  # None for unbound methods on Python 2
+        if owner is not None and not inspect.isclass(owner):
+            raise TypeError("bound methods are not cached")
+    if isinstance(value, dict):
+        return frozenset((k, _freeze_option(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze_option(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze_option(v) for v in value)
+    hash(value)
+    return value
+
+
+def get_datatable_subclass(name, datatable_class, meta):
+    """
+    Returns a subclass of ``datatable_class`` called ``name`` that uses ``meta`` as its ``Meta``
+    options.  Classes are cached by their base class and option values, so that views configuring
+    the same options on every request only pay for building the class (and its columns) once.
+    Options that cannot be hashed skip the cache.
+    """
+    options = {}
+    if not inspect.isclass(meta):
+        # Options can live on the instance's class, like the ``model`` of ``AutoMeta()``
+        options.update(vars(meta.__class__))
+    options.update(vars(meta))
+    options = dict((k, v) for k, v in options.items() if not k.startswith('__'))
+    try:
+        key = (name, datatable_class, _freeze_option(options))
+    except TypeError:
+        return type(name, (datatable_class,), {'Meta': meta})
+
+    with _datatable_class_cache_lock:
+        new_class = _datatable_class_cache.pop(key, None)
+        if new_class is not None:
+            _datatable_class_cache[key] = new_class  # Mark as most recently used
+            return new_class
+
+    new_class = type(name, (datatable_class,), {'Meta': meta})
+    with _datatable_class_cache_lock:
+        _datatable_class_cache[key] = new_class
+        while len(_datatable_class_cache) > DATATABLE_CLASS_CACHE_SIZE:
+            _datatable_class_cache.popitem(last=False)
+    return new_class
+
 
 class DatatableJSONResponseMixin(object):
+    # Unpaged (``pageLength=-1``) requests are streamed in chunks of ``stream_chunk_size`` records
+    # instead of being serialized as a single string when this is enabled.
+    stream_unpaged = False
+    stream_chunk_size = 1000
+
     # AJAX response router
     def get(self, request, *args, **kwargs):
         """
@@ -39,19 +108,69 @@ class DatatableJSONResponseMixin(object):
 
         # Ensure the object list is calculated.
         # Calling get_records() will do this implicitly, but we want simultaneous access to the
-        # 'total_initial_record_count', and 'unpaged_record_count' values.
+        # 'total_initial_record_count', and 'unpaged_record_count' values.  The records are read
+        # first, since a 'window' count strategy takes the counts from the page query.
         datatable.populate_records()
 
-        response_data = {
+        data = [self.get_json_record(record) for record in datatable.get_records()]
+        response_data = self.get_json_response_envelope(datatable)
+        response_data['data'] = data
+        if datatable.next_cursor is not None:
+            response_data['cursor'] = datatable.next_cursor
+        return response_data
+
+    def get_json_response_envelope(self, datatable):
+        """
+        Returns the part of :py:meth:`get_json_response_object` that describes the result set as a
+        whole, without the ``'data'`` list of records.
+        """
+        return {
             'draw': self.request.GET.get('draw', None),
-            'recordsFiltered': datatable.total_initial_record_count,
-            'recordsTotal': datatable.unpaged_record_count,
-            'data': [dict(record, **{
-                'DT_RowId': record.pop('pk'),
-                'DT_RowData': record.pop('_extra_data'),
-            }) for record in datatable.get_records()],
+            'recordsTotal': datatable.total_initial_record_count,
+            'recordsFiltered': datatable.unpaged_record_count,
+            'countStrategies': {
+                'recordsTotal': datatable.total_initial_record_count_strategy,
+                'recordsFiltered': datatable.unpaged_record_count_strategy,
+            },
         }
-        return response_data
+
+    def get_json_record(self, record):
+        """ Moves the record's pk and extra data to the keys expected by dataTables.js. """
+        return dict(record, **{
+            'DT_RowId': record.pop('pk'),
+            'DT_RowData': record.pop('_extra_data'),
+        })
+
+    def get_json_response(self, datatable):
+        """
+        Returns the ``HttpResponse`` for the configured ``datatable``.  When :py:attr:`stream_unpaged`
+        is set and the client asked for every record, a ``StreamingHttpResponse`` is used instead so
+        that memory use does not grow with the size of the result.
+        """
+        if self.stream_unpaged and datatable.config['page_length'] == -1:
+            datatable.populate_records()
+            return StreamingHttpResponse(self.iter_json_response(datatable),
+                                         content_type="application/json")
+
+        response_data = self.get_json_response_object(datatable)
+        return HttpResponse(self.serialize_to_json(response_data),
+                            content_type="application/json")
+
+    def iter_json_response(self, datatable):
+        """
+        Yields the serialized response for ``datatable`` in pieces: the envelope from
+        :py:meth:`get_json_response_envelope`, followed by each record from
+        :py:meth:`~datatableview.datatables.Datatable.iter_records`.
+        """
+        envelope = self.serialize_to_json(self.get_json_response_envelope(datatable))
+        yield envelope.rstrip()[:-1].rstrip() + ', "data": ['
+
+        records = datatable.iter_records(chunk_size=self.stream_chunk_size)
+        separator = ''
+        for record in records:
+            yield separator + self.serialize_to_json(self.get_json_record(record))
+            separator = ', '
+        yield ']}'
 
     def serialize_to_json(self, response_data):
         """ Returns the JSON string for the compiled data object. """
@@ -80,11 +199,7 @@ class DatatableMixin(DatatableJSONResponseMixin, MultipleObjectMixin):
 
         datatable = self.get_datatable()
         datatable.configure()
-        response_data = self.get_json_response_object(datatable)
-        response = HttpResponse(self.serialize_to_json(response_data),
-                                content_type="application/json")
-
-        return response
+        return self.get_json_response(datatable)
 
     # Configuration getters
     def get_datatable(self, **kwargs):
@@ -103,9 +218,8 @@ class DatatableMixin(DatatableJSONResponseMixin, MultipleObjectMixin):
             if meta_opt in kwargs:
                 setattr(opts, meta_opt, kwargs.pop(meta_opt))
 
-        datatable_class = type('%s_Synthesized' % (datatable_class.__name__,), (datatable_class,), {
-            'Meta': opts,
-        })
+        datatable_class = get_datatable_subclass('%s_Synthesized' % (datatable_class.__name__,),
+                                                 datatable_class, opts)
         return datatable_class(**kwargs)
 
     def get_datatable_class(self):
@@ -131,7 +245,9 @@ class DatatableMixin(DatatableJSONResponseMixin, MultipleObjectMixin):
 
         settings = ('columns', 'exclude', 'ordering', 'start_offset', 'page_length', 'search',
                     'search_fields', 'unsortable_columns', 'hidden_columns', 'footer',
-                    'structure_template', 'result_counter_id')
+                    'structure_template', 'result_counter_id', 'count_strategy',
+                    'total_count_strategy', 'search_strategy', 'search_backend',
+                    'concurrent_queries')
 
         for k in settings:
             v = getattr(self, k, None)
@@ -144,6 +260,10 @@ class DatatableMixin(DatatableJSONResponseMixin, MultipleObjectMixin):
     def preload_record_data(self, obj):
         return {}
 
+    # Runtime per-page hook
+    def preload_page_data(self, object_list):
+        return {}
+
     # Extra getters
     def get_datatable_context_name(self):
         return self.context_datatable_name
@@ -181,11 +301,7 @@ class MultipleDatatableMixin(DatatableJSONResponseMixin):
 
         datatable = self.get_active_ajax_datatable()
         datatable.configure()
-        response_data = self.get_json_response_object(datatable)
-        response = HttpResponse(self.serialize_to_json(response_data),
-                                content_type="application/json")
-
-        return response
+        return self.get_json_response(datatable)
 
     # Configuration getters
     def get_datatables(self, only=None):
@@ -206,15 +322,13 @@ class MultipleDatatableMixin(DatatableJSONResponseMixin):
                 if datatable_class is None:
                     class AutoMeta:
                         model = queryset.model
-                    datatable_class = type('%sDatatable' % (self.__class__.__name__,), (Datatable,), {
-                        'Meta': AutoMeta,
-                    })
+                    datatable_class = get_datatable_subclass(
+                        '%sDatatable' % (self.__class__.__name__,), Datatable, AutoMeta)
                 elif datatable_class._meta.model is None:
                     opts = datatable_class.options_class(datatable_class._meta)
                     opts.model = queryset.model
-                    datatable_class = type('%s_WithModel' % (datatable_class.__name__,), (datatable_class,), {
-                        'Meta': opts,
-                    })
+                    datatable_class = get_datatable_subclass(
+                        '%s_WithModel' % (datatable_class.__name__,), datatable_class, opts)
 
                 default_kwargs = {
                     'object_list': queryset,